@@ -0,0 +1,200 @@
+'''
+    batch diffing of many file pairs over a process pool
+
+    every pair is (old, new) where each side is a path, the blob contents as bytes,
+    or None for a missing side (added / removed file), merges take (base, ours, theirs)
+    triples of sides the same way
+
+    pairs are sorted by size so large files are scheduled first, small ones are grouped
+    into chunks to amortize the IPC, results are streamed back as chunks complete
+    workers never print, the engines run with verbose=False
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
+
+from diff import Diffs
+from hybrid import HybridDiff
+from lcs import LCS
+from merge import ThreeWayMerge
+from myers import Myers
+from patience import Patience
+
+# bytes of input grouped into a single task sent to a worker
+CHUNK_BYTES = 1 << 20
+
+
+def load_side(side : str | bytes | None) -> str:
+    '''
+        @returns: text of one side of a pair
+    '''
+    if side is None:
+        return ''
+    if isinstance(side, str):
+        with open(side, 'rb') as f:
+            side = f.read()
+
+    return side.decode('utf-8', 'surrogateescape')
+
+
+def side_size(side : str | bytes | None) -> int:
+    '''
+        @returns: size in bytes of one side of a pair, without reading files
+    '''
+    if side is None:
+        return 0
+    if isinstance(side, str):
+        return os.path.getsize(side)
+
+    return len(side)
+
+
+def diff_myers(s1 : str, s2 : str, **options) -> Diffs:
+    return Myers(s1, s2, linear=True, verbose=False, **options).diffs
+
+
+def diff_lcs(s1 : str, s2 : str, **options) -> Diffs:
+    return LCS(s1, s2, **options).to_diff()
+
+
+def diff_patience(s1 : str, s2 : str, **options) -> Diffs:
+    return Patience(s1, s2, **options).to_diff()
+
+
+def diff_hybrid(s1 : str, s2 : str, **options) -> Diffs:
+    return HybridDiff(s1, s2, **options).diffs
+
+
+ENGINES = {
+    'myers': diff_myers,
+    'lcs': diff_lcs,
+    'patience': diff_patience,
+    'hybrid': diff_hybrid,
+}
+
+MERGE_ENGINES = {
+    'lcs': LCS,
+    'patience': Patience,
+}
+
+
+def diff_chunk(chunk : list[tuple[int, str | bytes | None, str | bytes | None]], algorithm : str,
+               options : dict) -> list[tuple[int, Diffs]]:
+    '''
+        worker side, diffs every pair of a chunk
+
+        @returns: list of (position of the pair in the batch, diffs)
+    '''
+    engine = ENGINES[algorithm]
+
+    return [(i, engine(load_side(old), load_side(new), **options)) for i, old, new in chunk]
+
+
+def merge_chunk(chunk : list[tuple[int, str | bytes | None, str | bytes | None, str | bytes | None]], algorithm : str,
+                options : dict) -> list[tuple[int, str, int]]:
+    '''
+        worker side, merges every triple of a chunk
+
+        @returns: list of (position of the triple in the batch, merged text, number of conflicts)
+    '''
+    engine = MERGE_ENGINES[algorithm]
+
+    results = []
+    for i, base, ours, theirs in chunk:
+        merge = ThreeWayMerge(load_side(base), load_side(ours), load_side(theirs), engine, **options)
+        results.append((i, merge.merged(), merge.conflicts))
+
+    return results
+
+
+def make_chunks(pairs : list, chunk_bytes : int, workers : int) -> list[list]:
+    '''
+        sort the pairs (or triples) largest first and group consecutive ones until a chunk holds chunk_bytes
+        chunks are kept small enough that every worker gets a few of them
+
+        @returns: list of chunks of (position, *sides)
+    '''
+    sized = sorted(
+        ((sum(side_size(side) for side in sides), i, sides) for i, sides in enumerate(pairs)),
+        key=lambda t: -t[0],
+    )
+
+    total = sum(t[0] for t in sized)
+    chunk_bytes = max(1, min(chunk_bytes, total // (4 * workers)))
+
+    chunks = []
+    chunk, chunk_size = [], 0
+
+    for size, i, sides in sized:
+        chunk.append((i, *sides))
+        chunk_size += size
+
+        if chunk_size >= chunk_bytes:
+            chunks.append(chunk)
+            chunk, chunk_size = [], 0
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def diff_batch(pairs : list, algorithm : str = 'myers', workers : int | None = None,
+               chunk_bytes : int = CHUNK_BYTES, **options) -> Iterator[tuple[int, Diffs]]:
+    '''
+        diff many pairs in parallel
+
+        @param: pairs - list of (old, new), each side a path, bytes or None
+        @param: algorithm - 'myers' / 'lcs' / 'patience' / 'hybrid'
+        @param: workers - size of the process pool, defaults to the number of cpus
+        @param: chunk_bytes - input bytes grouped into one task
+        @param: options - passed on to the engine, e.g. timeout
+
+        @yields: (position of the pair in pairs, diffs) in completion order
+    '''
+    if algorithm not in ENGINES:
+        raise ValueError(f'unknown diff algorithm {algorithm}')
+
+    workers = workers or os.cpu_count() or 1
+    chunks = make_chunks(pairs, chunk_bytes, workers)
+
+    if workers == 1 or len(chunks) == 1:
+        for chunk in chunks:
+            yield from diff_chunk(chunk, algorithm, options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(diff_chunk, chunk, algorithm, options) for chunk in chunks]
+
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def merge_batch(triples : list, algorithm : str = 'lcs', workers : int | None = None,
+                chunk_bytes : int = CHUNK_BYTES, **options) -> Iterator[tuple[int, str, int]]:
+    '''
+        three-way merge many files in parallel, see diff_batch
+
+        @param: triples - list of (base, ours, theirs), each side a path, bytes or None
+        @param: algorithm - 'lcs' / 'patience'
+        @param: options - passed on to the engine, e.g. timeout
+
+        @yields: (position of the triple in triples, merged text, number of conflicts) in completion order
+    '''
+    if algorithm not in MERGE_ENGINES:
+        raise ValueError(f'unknown merge algorithm {algorithm}')
+
+    workers = workers or os.cpu_count() or 1
+    chunks = make_chunks(triples, chunk_bytes, workers)
+
+    if workers == 1 or len(chunks) == 1:
+        for chunk in chunks:
+            yield from merge_chunk(chunk, algorithm, options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(merge_chunk, chunk, algorithm, options) for chunk in chunks]
+
+        for future in as_completed(futures):
+            yield from future.result()
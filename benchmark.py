@@ -0,0 +1,311 @@
+'''
+    benchmarks for the diff engines and tree hashing
+
+    inputs are generated from a seed, so every run measures the same work
+        corpus - pair of texts of a given size, edit density and repetitiveness
+        tree   - directory tree of a given file count and depth
+
+    run as: python benchmark.py [--save] [--baseline path] [--tolerance factor]
+        --save      store the results as the new baseline
+        otherwise   compare against the baseline and exit with status 1 on a regression
+'''
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from tabulate import tabulate
+
+from filetree import create_file_tree_recursive
+from lcs import LCS
+from myers import Myers
+
+# location of the stored results compared against
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# a case regresses when its time or peak memory grows by more than this factor
+TOLERANCE = 1.5
+
+# lines a repetitive text is built from, like the braces and blank lines of source code
+REPEATED_LINES = ['}', '', '{', '    return None', 'else:', '#']
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta', 'iota', 'kappa']
+
+
+class MyersEngine(Myers):
+    '''
+        Myers without the cleanup and printing done in Myers.__init__
+        only the edit script is computed
+    '''
+    def __init__(self, s1 : str, s2 : str, linear : bool = False) -> None:
+        self.s1, self.s2 = s1, s2
+
+        self.deadline, self.max_d, self.degraded = None, None, False
+
+        if linear:
+            self.edits = self.linear_edit()
+        else:
+            self.edit_graph_trace = self.shortest_edit()
+            self.edit_patches = self.backtrack()
+
+
+def random_text(size : int, rng : random.Random, alphabet : str = 'abcdefghij \n') -> str:
+    '''
+        @returns: random text of given size
+    '''
+    return ''.join(rng.choice(alphabet) for _ in range(size))
+
+
+def mutate(text : str, rate : float, rng : random.Random, alphabet : str = 'abcdefghij \n') -> str:
+    '''
+        randomly deletes / inserts / replaces characters of the text
+
+        @param: rate - probability of a character being edited
+    '''
+    out = []
+    for ch in text:
+        r = rng.random()
+        if r < rate / 3:
+            continue
+        elif r < 2 * rate / 3:
+            out.append(rng.choice(alphabet))
+            out.append(ch)
+        elif r < rate:
+            out.append(rng.choice(alphabet))
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def measure(fn, *args) -> tuple:
+    '''
+        @returns: (result, wall time in seconds, peak traced memory in bytes)
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def corpus(lines : int, rate : float, repetitiveness : float, seed : int = 0) -> tuple[str, str]:
+    '''
+        pair of line based texts
+
+        @param: lines - number of lines of the initial text
+        @param: rate - probability of a line being edited, edited lines are deleted,
+                       replaced, preceded by a new line or changed in a few characters
+        @param: repetitiveness - probability of a line being one of REPEATED_LINES
+
+        @returns: (initial text, final text)
+    '''
+    rng = random.Random(seed)
+
+    def line() -> str:
+        if rng.random() < repetitiveness:
+            return rng.choice(REPEATED_LINES)
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))) + f' {rng.randrange(10 ** 6)}'
+
+    old = [line() for _ in range(lines)]
+    new = []
+
+    for text in old:
+        r = rng.random()
+        if r < rate / 4:
+            continue
+        elif r < rate / 2:
+            new.append(line())
+        elif r < 3 * rate / 4:
+            new.append(line())
+            new.append(text)
+        elif r < rate:
+            new.append(mutate(text, 0.2, rng))
+        else:
+            new.append(text)
+
+    return '\n'.join(old), '\n'.join(new)
+
+
+def make_tree(root : str, files : int, depth : int, file_size : int = 1024, seed : int = 0) -> None:
+    '''
+        creates a directory tree under root
+
+        @param: files - number of files, spread over the directories
+        @param: depth - nesting depth of the directories
+        @param: file_size - size of every file in bytes
+    '''
+    rng = random.Random(seed)
+
+    # directories at every level, each one holds up to 4 subdirectories
+    dirs = [root]
+    level = [root]
+    for d in range(depth):
+        level = [os.path.join(parent, f'dir_{d}_{i}') for parent in level for i in range(rng.randint(1, 4))]
+        dirs.extend(level)
+
+    for path in dirs:
+        os.makedirs(path, exist_ok=True)
+
+    for i in range(files):
+        with open(os.path.join(rng.choice(dirs), f'file_{i}.txt'), 'wb') as f:
+            f.write(rng.randbytes(file_size))
+
+
+def profile(fn, setup = None, repeat : int = 3) -> tuple[float, int]:
+    '''
+        @param: fn - function to profile, called with the result of setup
+        @param: setup - untimed function preparing the argument of fn
+
+        @returns: (best wall time in seconds over repeat untraced runs, peak traced memory in bytes)
+    '''
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+
+    arg = setup() if setup is not None else None
+    _, _, peak = measure(fn, arg)
+
+    return min(times), peak
+
+
+def run_suite(repeat : int = 3, seed : int = 0) -> dict:
+    '''
+        profiles every case of the suite
+
+        @returns: case name -> {'time': seconds, 'memory': peak bytes}
+    '''
+    s1, s2 = corpus(150, 0.1, 0.3, seed)
+    l1, l2 = corpus(1000, 0.05, 0.3, seed)
+    r1, r2 = corpus(3000, 0.05, 0.8, seed)
+    c1, c2 = corpus(600, 0.1, 0.3, seed)
+
+    def raw_diffs():
+        engine = MyersEngine(c1, c2, True)
+        return engine.edits.to_diffs()
+
+    tree_root = tempfile.mkdtemp(prefix='minigit_bench_')
+    try:
+        make_tree(tree_root, files=500, depth=4, seed=seed)
+
+        cases = {
+            'myers': (lambda _: Myers(s1, s2, verbose=False), None),
+            'myers linear': (lambda _: Myers(s1, s2, linear=True, verbose=False), None),
+            'lcs': (lambda _: LCS(l1, l2).to_diff(), None),
+            'lcs bit parallel': (lambda _: LCS(l1, l2, bit_parallel=True).to_diff(), None),
+            'lcs repetitive': (lambda _: LCS(r1, r2, bit_parallel=True).to_diff(), None),
+            'cleanup': (lambda diffs: diffs.cleanup(), raw_diffs),
+            'file tree': (lambda _: create_file_tree_recursive(tree_root).calculate_hash(), None),
+        }
+
+        results = {}
+        for name, (fn, setup) in cases.items():
+            elapsed, peak = profile(fn, setup, repeat)
+            results[name] = {'time': elapsed, 'memory': peak}
+    finally:
+        shutil.rmtree(tree_root)
+
+    return results
+
+
+def compare(results : dict, baseline : dict, tolerance : float = TOLERANCE) -> list[str]:
+    '''
+        prints the results next to the baseline
+
+        @returns: names of the cases slower or larger than tolerance times the baseline
+    '''
+    rows = []
+    regressions = []
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append([name, result['time'], None, result['memory'] // 1024, None, 'new'])
+            continue
+
+        time_ratio = result['time'] / base['time'] if base['time'] else 1
+        memory_ratio = result['memory'] / base['memory'] if base['memory'] else 1
+
+        status = 'ok'
+        if time_ratio > tolerance or memory_ratio > tolerance:
+            status = 'REGRESSION'
+            regressions.append(name)
+
+        rows.append([name, result['time'], time_ratio, result['memory'] // 1024, memory_ratio, status])
+
+    print(tabulate(rows, headers=['case', 'time s', 'x baseline', 'peak KB', 'x baseline', '']))
+
+    return regressions
+
+
+def myers_memory(sizes : tuple = (250, 500, 1000, 2000, 4000), rate : float = 0.05, seed : int = 0) -> list:
+    '''
+        compares peak memory of the trace based Myers engine against the linear space engine
+        for growing inputs with a fixed edit rate
+
+        peak memory per input character stays flat for the linear engine
+        and grows with the edit distance for the trace based one
+    '''
+    rng = random.Random(seed)
+    rows = []
+
+    for size in sizes:
+        s1 = random_text(size, rng)
+        s2 = mutate(s1, rate, rng)
+        n = len(s1) + len(s2)
+
+        _, t_trace, m_trace = measure(MyersEngine, s1, s2)
+        engine, t_linear, m_linear = measure(MyersEngine, s1, s2, True)
+
+        d = engine.edits.edit_distance()
+
+        rows.append([size, d, t_trace, t_linear, m_trace // 1024, m_linear // 1024, m_trace // n, m_linear // n])
+
+    print(tabulate(rows, headers=['size', 'D', 'trace s', 'linear s', 'trace KB', 'linear KB', 'trace B/char', 'linear B/char']))
+
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--myers-memory', action='store_true', help='run the Myers memory comparison instead')
+    args = parser.parse_args()
+
+    if args.myers_memory:
+        myers_memory()
+        sys.exit(0)
+
+    results = run_suite(args.repeat)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        compare(results, {})
+        sys.exit(0)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        compare(results, {})
+        print(f'no baseline at {args.baseline}, store one with --save')
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'regressions: {", ".join(regressions)}')
+        sys.exit(1)
@@ -0,0 +1,227 @@
+'''
+    content keyed cache of diff results
+
+    a result is keyed by (old blob id, new blob id, algorithm, level, options)
+        memory - LRU of the most recently used results
+        disk   - optional, one file per result under .minigit/cache, capped in size,
+                 the least recently used files are evicted first
+
+    a disk entry is
+        header  - level, number of diffs
+        diffs   - op code, size of the utf-8 encoded diff string, the string
+'''
+
+import hashlib
+import io
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+from chunk import CHUNK_THRESHOLD
+from constants import BLOB_TYPE, EQUAL_OP, DELETION_OP, INSERTION_OP
+from diff import Diff, Diffs
+from objects import hash_chunked, hash_object
+
+# level, number of diffs
+CACHE_HEADER = struct.Struct('>cQ')
+# op code, size of the encoded string
+CACHE_ENTRY = struct.Struct('>BQ')
+
+OP_CODES = {EQUAL_OP: 0, INSERTION_OP: 1, DELETION_OP: 2}
+CODE_OPS = {code: op for op, code in OP_CODES.items()}
+
+# results kept in memory
+MEMORY_ENTRIES = 1024
+# bytes of results kept on disk
+DISK_SIZE = 64 << 20
+
+
+def text_sha(s : str) -> str:
+    '''
+        @returns: id ObjectStore.write_file gives a utf-8 file with this content,
+                  the blob id, or the chunk list id from CHUNK_THRESHOLD bytes on
+    '''
+    data = s.encode('utf-8', 'surrogateescape')
+
+    if len(data) >= CHUNK_THRESHOLD:
+        return hash_chunked(io.BytesIO(data))
+    return hash_object(BLOB_TYPE, data)
+
+
+class DiffCache:
+    '''
+        two layer LRU cache of Diffs
+
+        results are stored as (op, string) runs, every get returns fresh Diff objects
+        so callers are free to clean up or modify them
+    '''
+    def __init__(self, cache_dir : str | None = None, max_entries : int = MEMORY_ENTRIES,
+                 max_disk_bytes : int = DISK_SIZE) -> None:
+        '''
+            @param: cache_dir - directory of the disk layer (usually .minigit/cache), None for memory only
+            @param: max_entries - results kept in memory
+            @param: max_disk_bytes - size cap of the disk layer
+        '''
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        # key -> (level, ((op, string), ...))
+        self.memory = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.disk_bytes = 0
+        if cache_dir is not None and os.path.isdir(cache_dir):
+            with os.scandir(cache_dir) as it:
+                self.disk_bytes = sum(entry.stat().st_size for entry in it if not entry.name.startswith('tmp_'))
+
+    @staticmethod
+    def key(old_sha : str, new_sha : str, algorithm : str, level : str, options : dict | None = None) -> str:
+        '''
+            @param: old_sha / new_sha - blob ids of both sides
+            @param: algorithm - name of the diff engine
+            @param: level - level of the diffs ('c' / 'w' / 'l')
+            @param: options - engine and cleanup options that change the result
+
+            @returns: hex digest identifying the result
+        '''
+        opts = ','.join(f'{name}={options[name]!r}' for name in sorted(options or {}))
+        return hashlib.sha1(f'{old_sha} {new_sha} {algorithm} {level} {opts}'.encode('utf-8')).hexdigest()
+
+    def text_key(self, s1 : str, s2 : str, algorithm : str, level : str, options : dict | None = None) -> str:
+        '''
+            @returns: key of the result of diffing two texts, see key
+        '''
+        return self.key(text_sha(s1), text_sha(s2), algorithm, level, options)
+
+    def entry_path(self, key : str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def remember(self, key : str, entry : tuple) -> None:
+        '''
+            add an entry to the memory layer, evicting the least recently used ones
+        '''
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key : str) -> Diffs | None:
+        '''
+            @returns: cached Diffs, None on a miss
+        '''
+        entry = self.memory.get(key)
+
+        if entry is not None:
+            self.memory.move_to_end(key)
+        elif self.cache_dir is not None:
+            try:
+                with open(self.entry_path(key), 'rb') as f:
+                    entry = self.decode(f.read())
+                # the modification time orders the disk entries for eviction
+                os.utime(self.entry_path(key))
+            except FileNotFoundError:
+                pass
+            else:
+                self.remember(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        level, runs = entry
+        return Diffs([Diff(op, None if op == INSERTION_OP else s, None if op == DELETION_OP else s) for op, s in runs], level)
+
+    def put(self, key : str, diffs : Diffs) -> None:
+        '''
+            store a result in memory and, if there is a disk layer, on disk
+        '''
+        entry = (diffs.level, tuple((d.op, d.diff_str) for d in diffs.diffs))
+        self.remember(key, entry)
+
+        if self.cache_dir is None or os.path.exists(self.entry_path(key)):
+            return
+
+        data = self.encode(entry)
+        if len(data) > self.max_disk_bytes:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.entry_path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.disk_bytes += len(data)
+        if self.disk_bytes > self.max_disk_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        '''
+            remove the least recently used disk entries until the disk layer
+            is back under three quarters of its cap
+        '''
+        with os.scandir(self.cache_dir) as it:
+            entries = [(entry.stat(), entry.path) for entry in it if not entry.name.startswith('tmp_')]
+
+        entries.sort(key=lambda e: e[0].st_mtime_ns)
+
+        self.disk_bytes = sum(st.st_size for st, _ in entries)
+
+        for st, path in entries:
+            if self.disk_bytes <= self.max_disk_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.disk_bytes -= st.st_size
+
+    def clear(self) -> None:
+        '''
+            drop every cached result, the hit and miss counts are kept
+        '''
+        self.memory.clear()
+
+        if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
+        self.disk_bytes = 0
+
+    @staticmethod
+    def encode(entry : tuple) -> bytes:
+        level, runs = entry
+
+        parts = [CACHE_HEADER.pack(level.encode('ascii'), len(runs))]
+        for op, s in runs:
+            data = s.encode('utf-8', 'surrogateescape')
+            parts.append(CACHE_ENTRY.pack(OP_CODES[op], len(data)))
+            parts.append(data)
+
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(data : bytes) -> tuple:
+        level, count = CACHE_HEADER.unpack_from(data, 0)
+        pos = CACHE_HEADER.size
+
+        runs = []
+        for _ in range(count):
+            code, size = CACHE_ENTRY.unpack_from(data, pos)
+            pos += CACHE_ENTRY.size
+            runs.append((CODE_OPS[code], data[pos:pos + size].decode('utf-8', 'surrogateescape')))
+            pos += size
+
+        return level.decode('ascii'), tuple(runs)
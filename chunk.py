@@ -0,0 +1,105 @@
+'''
+    content defined chunking of large blobs (FastCDC style)
+
+    files of at least CHUNK_THRESHOLD bytes are split at content defined cut points, so an
+    edit only moves the cut points next to it and the other chunks are shared between
+    versions of the file
+
+    instead of rolling a hash over every byte in Python, every byte is mapped to one
+    pseudo-random feature bit with bytes.translate and the feature bits are searched for
+    a fixed pattern with bytes.find, a cut point is the end of a match, so it depends on
+    the last PATTERN_BITS bytes only, both passes run in C at memory speed
+
+    like FastCDC the chunking is normalized: the first MIN_CHUNK bytes of a chunk are skipped,
+    up to AVG_CHUNK a longer pattern has to match, after it a shorter one (its suffix),
+    chunks are cut at MAX_CHUNK if nothing matches (e.g. in runs of a single byte)
+
+    every chunk is stored as a blob object of its own, the file is stored as a chunk list
+        one (raw id of the chunk blob, size of the chunk) record per chunk, in file order
+    and the id of the chunk list is the hash of the file in its tree, see objects.hash_chunked
+'''
+
+import hashlib
+import struct
+from typing import BinaryIO, Iterator
+
+# files at least this large are chunked
+CHUNK_THRESHOLD = 8 << 20
+
+MIN_CHUNK = 16 << 10
+AVG_CHUNK = 64 << 10
+MAX_CHUNK = 256 << 10
+
+# bytes read from the file at once
+READ_SIZE = 1 << 20
+
+# raw id of the chunk blob, size of the chunk
+CHUNK_ENTRY = struct.Struct('>20sQ')
+
+# the feature table and the patterns must never change, chunk boundaries and so file hashes depend on them
+FEATURES = bytes(hashlib.sha1(bytes([i])).digest()[0] & 1 for i in range(256))
+
+# a match is expected every 2 ** bits bytes
+PATTERN_BITS = 17
+PATTERN_S = bytes(hashlib.sha1(b'chunk pattern').digest()[i] & 1 for i in range(PATTERN_BITS))
+PATTERN_L = PATTERN_S[4:]
+
+
+def cut_point(features : bytearray) -> int:
+    '''
+        @param: features - feature bits of the start of the remaining input,
+                           at least MAX_CHUNK bytes unless the input ends
+
+        @returns: size of the next chunk
+    '''
+    n = len(features)
+    if n <= MIN_CHUNK:
+        return n
+
+    end = min(n, MAX_CHUNK)
+    normal = min(AVG_CHUNK, end)
+
+    i = features.find(PATTERN_S, MIN_CHUNK, normal)
+    if i != -1:
+        return i + len(PATTERN_S)
+
+    i = features.find(PATTERN_L, max(MIN_CHUNK, normal - len(PATTERN_L) + 1), end)
+    if i != -1:
+        return i + len(PATTERN_L)
+
+    return end
+
+
+def iter_chunks(f : BinaryIO) -> Iterator[bytes]:
+    '''
+        streams the chunks of a file, at most MAX_CHUNK + READ_SIZE bytes and their feature bits are buffered
+
+        @yields: chunk contents in file order
+    '''
+    buf = bytearray()
+    features = bytearray()
+    eof = False
+
+    while True:
+        while len(buf) < MAX_CHUNK and not eof:
+            data = f.read(READ_SIZE)
+            if data:
+                buf += data
+                features += data.translate(FEATURES)
+            else:
+                eof = True
+
+        if not buf:
+            return
+
+        n = cut_point(features)
+        yield bytes(buf[:n])
+        del buf[:n]
+        del features[:n]
+
+
+def parse_chunk_list(data : bytes) -> list[tuple[str, int]]:
+    '''
+        @returns: list of (hex digest, size) of the chunks
+    '''
+    return [(digest.hex(), size) for digest, size in CHUNK_ENTRY.iter_unpack(data)]
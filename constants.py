@@ -5,3 +5,32 @@
 INSERTION_OP = '+'
 DELETION_OP = '-'
 EQUAL_OP = ''
+
+MINIGIT_DIR = '.minigit'
+IGNORE_FILE = '.minigitignore'
+
+# directories never walked into, regardless of the ignore rules
+ALWAYS_IGNORED = {MINIGIT_DIR, '.git'}
+
+BLOB_TYPE = 'blob'
+TREE_TYPE = 'tree'
+# chunk list of a large file, see chunk.py
+CHUNKS_TYPE = 'chunks'
+
+OBJECTS_DIR = 'objects'
+PACK_DIR = 'pack'
+CACHE_DIR = 'cache'
+
+# tree change statuses
+ADDED = 'A'
+REMOVED = 'D'
+MODIFIED = 'M'
+RENAMED = 'R'
+
+# three-way merge region kinds
+UNCHANGED = 'U'
+OURS = 'O'
+THEIRS = 'T'
+# the same change on both sides
+BOTH = 'B'
+CONFLICT = 'C'
@@ -0,0 +1,208 @@
+'''
+    copy / insert delta encoding between two byte strings
+
+    a delta is
+        header  - base length, target length
+        ops     - COPY (offset, length) from the base or INSERT (length, literal bytes)
+'''
+
+import struct
+from operator import itemgetter
+
+DELTA_HEADER = struct.Struct('>QQ')
+COPY_OP = struct.Struct('>BQI')
+INSERT_OP = struct.Struct('>BI')
+
+COPY_CODE = 1
+INSERT_CODE = 2
+
+# length of the base blocks indexed for matching
+BLOCK_SIZE = 16
+
+
+def encode_insert(parts : list, data : bytes | memoryview) -> None:
+    if len(data):
+        parts.append(INSERT_OP.pack(INSERT_CODE, len(data)))
+        parts.append(bytes(data))
+
+
+def common_length(a : bytes, i : int, b : bytes, j : int) -> int:
+    '''
+        the compared length doubles while the slices match and is then bisected,
+        so the bytes are compared in C in O(log n) slices
+
+        @returns: length of the common prefix of a[i:] and b[j:]
+    '''
+    limit = min(len(a) - i, len(b) - j)
+
+    lo, step = 0, BLOCK_SIZE
+    while lo < limit:
+        hi = min(lo + step, limit)
+        if a[i + lo:i + hi] != b[j + lo:j + hi]:
+            break
+        lo, step = hi, step * 2
+    else:
+        return limit
+
+    # a[i:i + lo] matches, a[i:i + hi] does not
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[i + lo:i + mid] == b[j + lo:j + mid]:
+            lo = mid
+        else:
+            hi = mid
+
+    return lo
+
+
+def block_index(base : bytes, block_size : int = BLOCK_SIZE) -> dict[bytes, int]:
+    '''
+        @returns: aligned block of the base -> offset of its first occurrence
+    '''
+    n_base = len(base)
+    block = struct.Struct(f'{block_size}s')
+
+    blocks = list(map(itemgetter(0), block.iter_unpack(memoryview(base)[:n_base - n_base % block_size])))
+    return dict(zip(reversed(blocks), range((len(blocks) - 1) * block_size, -1, -block_size)))
+
+
+def block_hits(target : bytes, blocks : dict | set, block_size : int = BLOCK_SIZE) -> bytearray:
+    '''
+        the lookups run in C, one pass per offset modulo block_size
+
+        @param: blocks - blocks to look for, e.g. the keys of one or more block indexes
+
+        @returns: flag per target position, set where the block starting there is in blocks
+    '''
+    n_target = len(target)
+    block = struct.Struct(f'{block_size}s')
+
+    hits = bytearray(n_target)
+    view = memoryview(target)
+    for r in range(min(block_size, n_target - block_size + 1)):
+        end = r + (n_target - r) // block_size * block_size
+        hits[r:end:block_size] = bytes(map(blocks.__contains__, map(itemgetter(0), block.iter_unpack(view[r:end]))))
+
+    return hits
+
+
+def create_delta(base : bytes, target : bytes, block_size : int = BLOCK_SIZE, max_size : int | None = None,
+                 index : dict[bytes, int] | None = None, hits : bytearray | None = None) -> bytes | None:
+    '''
+        greedy copy / insert delta of target against base
+
+        every aligned block of the base is indexed, target positions are looked up
+        in the index and matches are extended in both directions
+
+        the lookups are done up front by block_hits, the greedy pass jumps from hit to hit
+        instead of stepping over mismatching bytes one by one in Python
+
+        a match never extends backwards over a whole block of the pending insertion, that
+        block would have been a hit, so all but its last block_size bytes are sure to be
+        inserted and count against max_size
+
+        @param: max_size - largest delta of interest, the search stops once it is exceeded
+        @param: index - block_index of the base, when deltas against it are made repeatedly
+        @param: hits - block_hits of the target for the index or a superset of it, e.g. when
+                       several bases are tried for the same target
+
+        @returns: encoded delta, None if it would be larger than max_size
+    '''
+    parts = [DELTA_HEADER.pack(len(base), len(target))]
+    size = DELTA_HEADER.size
+
+    n_base, n_target = len(base), len(target)
+
+    if index is None:
+        index = block_index(base, block_size)
+    if hits is None:
+        hits = block_hits(target, index, block_size)
+
+    pos = 0
+    insert_start = 0
+
+    while (pos := hits.find(1, pos)) != -1:
+        j = index.get(target[pos:pos + block_size])
+
+        if j is None:
+            # a hit of another base
+            pos += 1
+
+            pending = pos - insert_start - block_size + 1
+            if max_size is not None and pending > 0 and size + INSERT_OP.size + pending > max_size:
+                return None
+            continue
+
+        # extend the match backwards into the pending insertion
+        start_t, start_b = pos, j
+        while start_t > insert_start and start_b > 0 and target[start_t - 1] == base[start_b - 1]:
+            start_t, start_b = start_t - 1, start_b - 1
+
+        # extend the match forwards
+        length = block_size + common_length(target, pos + block_size, base, j + block_size)
+        end_t, end_b = pos + length, j + length
+
+        if start_t > insert_start:
+            size += INSERT_OP.size + start_t - insert_start
+        size += COPY_OP.size
+        if max_size is not None and size > max_size:
+            return None
+
+        encode_insert(parts, target[insert_start:start_t])
+        parts.append(COPY_OP.pack(COPY_CODE, start_b, end_t - start_t))
+
+        pos = insert_start = end_t
+
+    if insert_start < n_target:
+        size += INSERT_OP.size + n_target - insert_start
+    if max_size is not None and size > max_size:
+        return None
+
+    encode_insert(parts, target[insert_start:])
+
+    return b''.join(parts)
+
+
+def apply_delta(base : bytes | memoryview, delta : bytes | memoryview) -> bytes:
+    '''
+        rebuild the target from the base and a delta created by create_delta
+
+        the target is allocated once and the ops copy into it from views of the
+        base and the delta, no intermediate slices are made
+    '''
+    base = memoryview(base)
+    delta = memoryview(delta)
+
+    base_len, target_len = DELTA_HEADER.unpack_from(delta, 0)
+    if base_len != len(base):
+        raise ValueError('delta does not apply to this base')
+
+    out = bytearray(target_len)
+    view = memoryview(out)
+    pos, written = DELTA_HEADER.size, 0
+
+    while pos < len(delta):
+        code = delta[pos]
+
+        if code == COPY_CODE:
+            _, offset, length = COPY_OP.unpack_from(delta, pos)
+            source = base[offset:offset + length]
+            pos += COPY_OP.size
+        elif code == INSERT_CODE:
+            _, length = INSERT_OP.unpack_from(delta, pos)
+            pos += INSERT_OP.size
+            source = delta[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f'invalid delta op {code}')
+
+        if len(source) != length or written + length > target_len:
+            raise ValueError('delta produced a target of the wrong size')
+
+        view[written:written + length] = source
+        written += length
+
+    if written != target_len:
+        raise ValueError('delta produced a target of the wrong size')
+
+    return bytes(out)
@@ -2,11 +2,19 @@
     implementation of a diff class
 
     implementation of diffs class
+
+    implementation of a compact offset based edit script
 '''
 
 __author__ = 'arka'
 
+from array import array
+from collections import deque
+from itertools import chain
+
 from tabulate import tabulate
+
+import stats
 from constants import EQUAL_OP, DELETION_OP, INSERTION_OP
 from utils import common_prefix, common_suffix
 
@@ -16,6 +24,8 @@ class Diff:
     '''
         implementation of character-level diff
     '''
+    __slots__ = ('op', 'old_str', 'new_str', 'len')
+
     def __init__(self, op: str, old_str: str | None, new_str: str | None) -> None:
         '''
             @param: op - diff operation, can be one of '=' / '+' / '-'
@@ -52,8 +62,8 @@ class Diff:
         self.len = len(s)
         
     def __iter__(self):
-        for each in self.__dict__.values():
-            yield each
+        for attr in self.__slots__:
+            yield getattr(self, attr)
 
     def prepend_diff(self, d : "Diff") -> None:
         '''
@@ -111,12 +121,100 @@ class Diff:
 
 
 
+class EditScript:
+    '''
+        compact edit script of s1 -> s2
+
+        runs of one op are stored as (op code, start in s1, start in s2, length) in parallel
+        array columns sharing the source texts, Diff objects and strings are only
+        materialized on demand
+    '''
+    __slots__ = ('s1', 's2', 'ops', 'old_starts', 'new_starts', 'lengths')
+
+    OP_CODES = {EQUAL_OP: 0, INSERTION_OP: 1, DELETION_OP: 2}
+    CODE_OPS = (EQUAL_OP, INSERTION_OP, DELETION_OP)
+
+    def __init__(self, s1 : str, s2 : str) -> None:
+        '''
+            @param: s1 - initial text
+            @param: s2 - final text
+        '''
+        self.s1, self.s2 = s1, s2
+
+        self.ops = array('b')
+        self.old_starts = array('q')
+        self.new_starts = array('q')
+        self.lengths = array('q')
+
+    def append(self, op : str, old_start : int, new_start : int, length : int = 1) -> None:
+        '''
+            append a run of edits, contiguous runs of the same op are coalesced
+
+            @param: op - diff operation, can be one of '=' / '+' / '-'
+            @param: old_start - position of the run in s1 (insertion point for insertions)
+            @param: new_start - position of the run in s2 (deletion point for deletions)
+            @param: length - number of characters in the run
+        '''
+        if length <= 0:
+            return
+
+        code = self.OP_CODES[op]
+
+        if self.ops and self.ops[-1] == code:
+            last = self.lengths[-1]
+            old_end = self.old_starts[-1] + (0 if code == 1 else last)
+            new_end = self.new_starts[-1] + (0 if code == 2 else last)
+
+            if old_end == old_start and new_end == new_start:
+                self.lengths[-1] = last + length
+                return
+
+        self.ops.append(code)
+        self.old_starts.append(old_start)
+        self.new_starts.append(new_start)
+        self.lengths.append(length)
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def diff(self, i : int) -> Diff:
+        '''
+            @returns: materialized diff of the i-th run
+        '''
+        op = self.CODE_OPS[self.ops[i]]
+        length = self.lengths[i]
+
+        old_str = None if op == INSERTION_OP else self.s1[self.old_starts[i]:self.old_starts[i] + length]
+        new_str = None if op == DELETION_OP else self.s2[self.new_starts[i]:self.new_starts[i] + length]
+
+        return Diff(op, old_str, new_str)
+
+    def __iter__(self):
+        for i in range(len(self.ops)):
+            yield self.diff(i)
+
+    def edit_distance(self) -> int:
+        '''
+            @returns: number of inserted and deleted characters
+        '''
+        return sum(length for code, length in zip(self.ops, self.lengths) if code)
+
+    def to_diffs(self, level : str = 'c') -> "Diffs":
+        '''
+            @returns: Diffs with one diff per run
+        '''
+        return Diffs(list(self), level)
+
+    def __repr__(self) -> str:
+        return tabulate(self)
+
+
 class Diffs:
     '''
         implementation of list of character-level / word-level / line-level diffs
     '''
 
-    # TODO: add merge line ops for merging line based diffs generated by lcs.py or do the merging of subsequences in-class
+    # line based diffs of lcs.py are merged three ways in merge.py
 
     def __init__(self, diffs : list[Diff], level : str = 'c') -> None:
         '''
@@ -144,149 +242,204 @@ class Diffs:
             reorder and merge like edit sections
 
             works at all levels - character/word/line
+
+            alternates single forward merge passes and chaff transposition
+            until no edit can be shifted any more
         '''
-        self.diffs.append(Diff(EQUAL_OP, '', ''))
+        changes = True
+        passes = 0
+        while changes:
+            self.merge_edits()
+            changes = self.transpose_chaffs()
+            passes += 1
 
-        del_count, ins_count = 0, 0
-        del_text, ins_text = '', ''
+        if stats.active is not None:
+            stats.active.add('cleanup.merge_passes', passes)
 
-        i = 0
+    def merge_edits(self) -> None:
+        '''
+            single forward pass merging consecutive deletions / insertions / equalities
+            common prefixes and suffixes of deletion-insertion pairs are factored out into the
+            surrounding equalities, empty diffs are dropped
 
-        while i < len(self.diffs):
-            if self.diffs[i].op == DELETION_OP:
-                del_count += 1
-                del_text += self.diffs[i].old_str       # type: ignore
-                i += 1
-            elif self.diffs[i].op == INSERTION_OP:
-                ins_count += 1
-                ins_text += self.diffs[i].new_str       # type: ignore
-                i += 1
-            else:
-                # handle out past discrepancies
-                if ins_count > 0 or del_count > 0:
-                    if ins_count > 0 and del_count > 0:
-                        # factor out common prefixes
-                        l = common_prefix(ins_text, del_text)
-                        if l > 0:
-                            x = i - del_count - ins_count - 1
-                            if x >= 0 and self.diffs[x].op == EQUAL_OP:
-                                self.diffs[x].update_diff(EQUAL_OP,  ins_text[:l])
-                            else:
-                                self.diffs.insert(0, Diff(EQUAL_OP, del_text[:l], ins_text[:l]))
-                            ins_text = ins_text[l:]
-                            del_text = del_text[l:]
-
-                        # factor out common suffixes
-                        l = common_suffix(ins_text, del_text)
-                        if l > 0:
-                            self.diffs[i].prepend_diff(Diff(EQUAL_OP, del_text[-l:], ins_text[-l:]))
-                            ins_text = ins_text[:-l]
-                            del_text = del_text[:-l]
-
-                    if ins_count == 0:
-                        self.diffs[i - del_count:i] = [Diff(DELETION_OP, del_text, None)]
-                    elif del_count == 0:
-                        self.diffs[i - ins_count:i] = [Diff(INSERTION_OP, None, ins_text)]
-                    else:
-                        self.diffs[i - del_count - ins_count:i] = [
-                            Diff(DELETION_OP, del_text, None),
-                            Diff(INSERTION_OP, None, ins_text)
-                        ]
-
-                    i -= (ins_count + del_count - 1)
-
-                    if del_count > 0:
-                        i += 1
-                    if ins_count > 0:
-                        i += 1
-                elif i > 0 and self.diffs[i-1].op == EQUAL_OP:
-                    # merge equality
-                    self.diffs[i-1].append_diff(self.diffs[i])
-                    del self.diffs[i]
-                else:
-                    i += 1
+            strings are collected as lists of parts and joined once, so the pass is linear
+        '''
+        # [op, parts] records of the merged diff
+        out = []
+
+        del_parts, ins_parts = [], []
+
+        for diff in chain(self.diffs, (Diff(EQUAL_OP, '', ''),)):
+            if diff.op == DELETION_OP:
+                del_parts.append(diff.old_str)
+                continue
+            if diff.op == INSERTION_OP:
+                ins_parts.append(diff.new_str)
+                continue
+
+            eq_parts = [diff.old_str]
+
+            if del_parts or ins_parts:
+                del_text, ins_text = ''.join(del_parts), ''.join(ins_parts)
+
+                if del_text and ins_text:
+                    # factor out common prefixes
+                    l = common_prefix(ins_text, del_text)
+                    if l > 0:
+                        if out and out[-1][0] == EQUAL_OP:
+                            out[-1][1].append(ins_text[:l])
+                        else:
+                            out.append([EQUAL_OP, [ins_text[:l]]])
+                        ins_text, del_text = ins_text[l:], del_text[l:]
+
+                    # factor out common suffixes
+                    l = common_suffix(ins_text, del_text)
+                    if l > 0:
+                        eq_parts.insert(0, ins_text[-l:])
+                        ins_text, del_text = ins_text[:-l], del_text[:-l]
 
-                del_count, ins_count = 0, 0
-                del_text, ins_text = '', ''
+                if del_text:
+                    out.append([DELETION_OP, [del_text]])
+                if ins_text:
+                    out.append([INSERTION_OP, [ins_text]])
 
-        self.transpose_chaffs()
+                del_parts, ins_parts = [], []
+
+            if len(eq_parts) > 1 or eq_parts[0]:
+                if out and out[-1][0] == EQUAL_OP:
+                    out[-1][1].extend(eq_parts)
+                else:
+                    out.append([EQUAL_OP, eq_parts])
 
-    def transpose_chaffs(self) -> None:
+        self.diffs = []
+        for op, parts in out:
+            text = ''.join(parts)
+            self.diffs.append(Diff(op, None if op == INSERTION_OP else text, None if op == DELETION_OP else text))
+
+    def transpose_chaffs(self) -> bool:
         '''
             A<ins>BA</ins>C -> <ins>AB</ins>AC  
             A<ins>BC</ins>B -> AB<ins>CB</ins>
 
-            return: diff with chaffs and transposed
+            single forward pass over a merged diff, the end of the diff counts as an empty
+            equality so a trailing edit is shifted over the equality before it as well
+
+            return: True if any edit was shifted, the diff then needs to be merged again
         '''
-        i = 1
+        diffs = self.diffs + [Diff(EQUAL_OP, '', '')]
+        out = []
         change = False
 
-        while i < len(self.diffs) - 1:
-            if self.diffs[i-1].op == EQUAL_OP and self.diffs[i+1].op == EQUAL_OP:
-                if self.diffs[i].diff_str.endswith(self.diffs[i-1].diff_str):                                                   # type: ignore
-                    self.diffs[i].diff_str = self.diffs[i-1].diff_str + self.diffs[i].diff_str[:len(self.diffs[i-1].diff_str)]  # type: ignore
-                    self.diffs[i+1].diff_str = self.diffs[i-1].diff_str + self.diffs[i+1].diff_str                              # type: ignore
-
-                    del self.diffs[i-1]
+        i = 0
+        while i < len(diffs):
+            diff = diffs[i]
+
+            if diff.op != EQUAL_OP and out and out[-1].op == EQUAL_OP and \
+                    i + 1 < len(diffs) and diffs[i + 1].op == EQUAL_OP:
+                prev_str = out[-1].diff_str
+                next_str = diffs[i + 1].diff_str
+
+                if prev_str and diff.diff_str.endswith(prev_str):                                       # type: ignore
+                    # shift the edit over the previous equality
+                    diff.diff_str = prev_str + diff.diff_str[:-len(prev_str)]                           # type: ignore
+                    diffs[i + 1].diff_str = prev_str + next_str                                         # type: ignore
+                    out[-1] = diff
                     change = True
-                elif self.diffs[i].diff_str.startswith(self.diffs[i+1].diff_str):                                               # type: ignore
-                    self.diffs[i-1].diff_str = self.diffs[i-1].diff_str + self.diffs[i+1].diff_str                              # type: ignore
-                    self.diffs[i].diff_str = self.diffs[i].diff_str[self.diffs[i+1].diff_str:] + self.diffs[i+1].diff_str       # type: ignore
-
-                    del self.diffs[i+1]
+                    i += 1
+                    continue
+                elif next_str and diff.diff_str.startswith(next_str):                                   # type: ignore
+                    # shift the edit over the next equality
+                    out[-1].diff_str = prev_str + next_str                                              # type: ignore
+                    diff.diff_str = diff.diff_str[len(next_str):] + next_str                            # type: ignore
+                    out.append(diff)
                     change = True
+                    i += 2
+                    continue
+
+            out.append(diff)
             i += 1
 
-        if change:
-            self.cleanup_merge()
+        if not out[-1].diff_str:
+            out.pop()
+
+        self.diffs = out
+
+        return change
 
     def cleanup_semantic(self) -> None:
         '''
             semantic cleanup of the diff improves human readability
 
+            an equality no longer than the changes on both of its sides is turned into
+            a deletion and an insertion, merging the changes around it
+
+            single pass over the diff with a stack of alternating equalities and change runs,
+            each equality is eliminated at most once and a fold moves the parts of the smaller
+            run into the larger one, so the pass takes O(n log n) time at worst
+
             returns: a semantically cleaned up version of the diff
         '''
-        equality_stack = []
-        preceding_changes = 0
-        succeeding_changes = 0
-
-        changes = False
+        if stats.active is not None:
+            stats.active.add('cleanup.semantic_passes')
+
+        # equality records are [EQUAL_OP, parts, length]
+        # change runs are [None, deletion parts, insertion parts, length of all changes], parts are deques
+        out = []
+
+        for diff in self.diffs:
+            if diff.op == EQUAL_OP:
+                if out and out[-1][0] == EQUAL_OP:
+                    out[-1][1].append(diff.old_str)
+                    out[-1][2] += diff.len
+                else:
+                    out.append([EQUAL_OP, [diff.old_str], diff.len])
+                continue
 
-        i = 0
+            if not out or out[-1][0] == EQUAL_OP:
+                out.append([None, deque(), deque(), 0])
 
-        while i < len(self.diffs):
-            if self.diffs[i].op == EQUAL_OP:
-                preceding_changes = succeeding_changes
-                equality_stack.append(i)
-                succeeding_changes = 0
+            run = out[-1]
+            if diff.op == DELETION_OP:
+                run[1].append(diff.old_str)
             else:
-                succeeding_changes += self.diffs[i].len
-                
-
-                if len(equality_stack) > 0:
-                    last_equality = equality_stack[-1]
-                    
-                    if self.diffs[last_equality].len <= preceding_changes and \
-                        self.diffs[last_equality].len <= succeeding_changes:
-                        # change chaff to insertion and deletion
-                        self.diffs.insert(last_equality, Diff(DELETION_OP, self.diffs[last_equality].diff_str, None))
-                        self.diffs[last_equality + 1].update_diff(INSERTION_OP, self.diffs[last_equality + 1].diff_str)
-
-                        # delete the currently processed equality
-                        equality_stack.pop()
-
-                        if len(equality_stack) != 0:
-                            # pop the previous equality since it needs to be processed
-                            # as its context has changed
-                            equality_stack.pop()
-                        if len(equality_stack):
-                            i = equality_stack[-1]
-                        else:
-                            i = -1
-                        preceding_changes, succeeding_changes = 0, 0
-                        changes = True
-
-            i += 1
-
-        if changes:
-            self.cleanup_semantic()
+                run[2].append(diff.new_str)
+            run[3] += diff.len
+
+            # fold chaff equalities into the change runs around them
+            while len(out) >= 2 and out[-2][0] == EQUAL_OP:
+                after = out[-1]
+                equality = out[-2]
+                before = out[-3] if len(out) >= 3 else None
+                preceding_changes = before[3] if before is not None else 0
+
+                if equality[2] > preceding_changes or equality[2] > after[3]:
+                    break
+
+                text = ''.join(equality[1])
+                length = preceding_changes + 2 * equality[2] + after[3]
+
+                if before is not None and len(before[1]) + len(before[2]) >= len(after[1]) + len(after[2]):
+                    # grow the run before the equality
+                    for parts, after_parts in zip(before[1:3], after[1:3]):
+                        parts.append(text)
+                        parts.extend(after_parts)
+                    before[3] = length
+                    del out[-2:]
+                else:
+                    # grow the run after the equality
+                    for parts, before_parts in zip(after[1:3], before[1:3] if before is not None else ((), ())):
+                        parts.appendleft(text)
+                        parts.extendleft(reversed(before_parts))
+                    after[3] = length
+                    del out[-3 if before is not None else -2:-1]
+
+        self.diffs = []
+        for record in out:
+            if record[0] == EQUAL_OP:
+                text = ''.join(record[1])
+                self.diffs.append(Diff(EQUAL_OP, text, text))
+            else:
+                if record[1]:
+                    self.diffs.append(Diff(DELETION_OP, ''.join(record[1]), None))
+                if record[2]:
+                    self.diffs.append(Diff(INSERTION_OP, None, ''.join(record[2])))
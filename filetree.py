@@ -1,54 +1,361 @@
-import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Iterator
+
+import stats
+from chunk import CHUNK_THRESHOLD
+from constants import ALWAYS_IGNORED, BLOB_TYPE, TREE_TYPE
+from ignore import IgnoreRules
+from index import Index
+from objects import ObjectStore, hash_chunked, hash_object, hash_stream
+
+
+def hash_file(path : str) -> str:
+    '''
+        @returns: hex id of the blob of the file,
+                  of its chunk list for files of at least CHUNK_THRESHOLD bytes
+    '''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= CHUNK_THRESHOLD:
+            return hash_chunked(f)
+        return hash_stream(f)
+
+
+def cached_hash(path : str, st : os.stat_result, index : Index | None, store : ObjectStore | None) -> str | None:
+    '''
+        @returns: hash of the blob from the index, None if the file has to be read because
+                  it changed, is not indexed or is missing from the store
+    '''
+    content_hash = index.lookup(path, st) if index is not None else None
+
+    if stats.active is not None:
+        stats.active.add('filetree.stat')
+        if content_hash is not None:
+            stats.active.add('filetree.index_hits')
+
+    if store is not None and content_hash is not None and not store.contains(content_hash):
+        return None
+    return content_hash
+
+
+def read_hash(path : str, store : ObjectStore | None = None) -> str:
+    '''
+        reads the file, storing it if there is a store
+
+        @returns: hash of the blob
+    '''
+    return hash_file(path) if store is None else store.write_file(path)
+
+
+def record_hash(path : str, st : os.stat_result, content_hash : str, hashed : bool, index : Index | None) -> None:
+    '''
+        @param: hashed - the file was read to get the hash
+    '''
+    if hashed and stats.active is not None:
+        stats.active.add('filetree.hashed')
+        stats.active.add('filetree.bytes_read', st.st_size)
+
+    if index is not None:
+        index.update(path, st, content_hash)
+
+
+def blob_hash(path : str, st : os.stat_result, index : Index | None, store : ObjectStore | None) -> tuple[str, bool]:
+    '''
+        hash of a blob, from the index if the file is unchanged, the index is updated
+
+        @param: st - stat data of the file
+        @param: index - stat cache
+        @param: store - object store, a file that is read is stored in the same read
+
+        @returns: (hash of the blob, True if the file was read)
+    '''
+    content_hash = cached_hash(path, st, index, store)
+
+    hashed = content_hash is None
+    if content_hash is None:
+        content_hash = read_hash(path, store)
+
+    record_hash(path, st, content_hash, hashed, index)
+
+    return content_hash, hashed
+
 
 class FileTreeNode:
     '''
         implementation of a minigit filetree object
+
+        hashes form a merkle tree: every node is hashed exactly once and the digest is cached
+        in content_hash, both for blobs (hash of the file) and for trees (hash of the serialized tree)
     '''
-    def __init__(self, children : list["FileTreeNode"], path : str, is_blob : bool) -> None:
+    def __init__(self, children : list["FileTreeNode"], path : str, is_blob : bool, content_hash : str | None = None) -> None:
+        '''
+            @param: children - child nodes, already hashed
+            @param: content_hash - known hash of the blob (e.g. from the index), skips reading the file
+        '''
         self.children = children
         self.path = path
         self.is_blob = is_blob
+        self.content_hash = content_hash
+        self.parent = None
+
+        self.children_by_name = {}
+        for child in children:
+            child.parent = self
+            self.children_by_name[os.path.basename(child.path)] = child
 
         self.calculate_hash()
     
-    def calculate_hash(self) -> None:
+    def calculate_hash(self) -> str:
         '''
             calculate SHA-1 hash using hashes of the children objects or of the file object if it is a blob
+            cached hashes are reused, only invalidated nodes are rehashed
+
+            @returns: hex digest of the node
         '''
+        if self.content_hash is not None:
+            return self.content_hash
 
         if self.is_blob:
-            with open(self.path, 'rb') as f:
-                digest = hashlib.file_digest(f, 'sha1')
-                self.content_hash = digest.hexdigest()
+            self.content_hash = hash_file(self.path)
+
+            if stats.active is not None:
+                stats.active.add('filetree.hashed')
+                stats.active.add('filetree.bytes_read', os.path.getsize(self.path))
         else:
-            hash = hashlib.sha1()
+            self.content_hash = hash_object(TREE_TYPE, self.serialize())
+
+        return self.content_hash
+
+    def serialize(self) -> bytes:
+        '''
+            serialize a directory node as a tree object
+            one b'<type> <name>\\0<20 byte digest>' record per child, in tree order (by name)
+        '''
+        parts = []
+        for child in self.children:
+            parts.append(f'{BLOB_TYPE if child.is_blob else TREE_TYPE} '.encode('ascii'))
+            parts.append(os.path.basename(child.path).encode('utf-8', 'surrogateescape'))
+            parts.append(b'\0')
+            parts.append(bytes.fromhex(child.calculate_hash()))
 
-            for child in self.children:
-                child.calculate_hash()
-                hash.update(bytes.fromhex(child.content_hash))
+        return b''.join(parts)
 
-            self.hash = hash.hexdigest()
+    def invalidate(self) -> None:
+        '''
+            drop the cached hash of this node and of all its ancestors
+        '''
+        self.content_hash = None
+
+        # an invalidated ancestor implies all of its ancestors are invalidated too
+        node = self.parent
+        while node is not None and node.content_hash is not None:
+            node.content_hash = None
+            node = node.parent
+
+    def find(self, path : str) -> "FileTreeNode | None":
+        '''
+            @param: path - path of a node below (or equal to) this node
+
+            @returns: the node at path if it is part of the tree
+        '''
+        rel_path = os.path.relpath(path, self.path)
+        if rel_path == os.curdir:
+            return self
+        if rel_path.startswith(os.pardir):
+            return None
+
+        node = self
+        for name in rel_path.split(os.sep):
+            node = node.children_by_name.get(name)
+            if node is None:
+                return None
+
+        return node
+
+    def mark_dirty(self, path : str) -> str:
+        '''
+            rehash a modified blob (or everything below a directory) and its ancestor chain
+            cost is proportional to the depth of the path instead of the size of the tree
 
+            @param: path - path of a node in the tree
 
-def create_file_tree_recursive(cwd):
+            @returns: new hash of this node
+        '''
+        node = self.find(path)
+        if node is None:
+            raise KeyError(path)
+
+        stack = [node]
+        while stack:
+            dirty = stack.pop()
+            dirty.content_hash = None
+            stack.extend(dirty.children)
+
+        node.invalidate()
+
+        return self.calculate_hash()
+
+
+def walk_tree(root : str, ignore : IgnoreRules | None = None, prefix : str = '') -> Iterator[tuple[str, list[os.DirEntry]]]:
+    '''
+        iterative scandir walk of the directory tree
+
+        ignored directories are pruned before they are opened, the DirEntry objects
+        carry the file type (and cached stat data) so no extra stat calls are made
+
+        @param: root - directory to walk
+        @param: ignore - compiled ignore rules, paths are matched relative to root
+        @param: prefix - path of root relative to the root of the ignore rules, ending in '/'
+
+        @returns: generator of (directory path, non ignored entries) in pre-order,
+                  entries keep the order of the directory listing
+    '''
+    stack = [(root, prefix)]
+
+    while stack:
+        path, rel_path = stack.pop()
+        entries = []
+
+        with os.scandir(path) as it:
+            for entry in it:
+                is_dir = entry.is_dir()
+
+                if is_dir and entry.name in ALWAYS_IGNORED:
+                    continue
+                if not is_dir and not entry.is_file():
+                    continue
+                if ignore is not None and ignore.is_ignored(rel_path + entry.name, is_dir):
+                    continue
+
+                if is_dir:
+                    stack.append((entry.path, rel_path + entry.name + '/'))
+
+                entries.append(entry)
+
+        yield path, entries
+
+
+def assemble_tree(root : str, dirs : list[tuple[str, list[os.DirEntry]]], hashes : dict) -> FileTreeNode:
     '''
-        scour the current working directory recursively
+        build the file tree bottom-up from a pre-order directory listing
+        children are ordered by name, so the tree hash does not depend on the listing order
+
+        @param: dirs - output of walk_tree
+        @param: hashes - known blob hashes by path, missing blobs are hashed when their node is built
+    '''
+    # children of a directory come after it in pre-order, so they are built first
+    nodes = {}
+    for path, entries in reversed(dirs):
+        children = [
+            nodes.pop(entry.path) if entry.is_dir() else FileTreeNode([], entry.path, True, hashes.get(entry.path))
+            for entry in sorted(entries, key=lambda entry: entry.name)
+        ]
+        nodes[path] = FileTreeNode(children, path, False)
+
+    return nodes[root]
+
+
+def assemble_paths(root : str, dirs : set[str], hashes : dict[str, str]) -> FileTreeNode:
+    '''
+        build the file tree bottom-up from known paths, without listing any directory
+
+        @param: dirs - paths of all directories, including root
+        @param: hashes - hashes of all blobs by path, every blob lies in one of dirs
+
+        @returns: same tree as assemble_tree over a listing of these paths
+    '''
+    children = {path: [] for path in dirs}
+    for path, content_hash in hashes.items():
+        children[os.path.dirname(path)].append(FileTreeNode([], path, True, content_hash))
+
+    # deeper directories first, so subtrees are built before their parents
+    nodes = {}
+    for path in sorted(dirs, key=lambda path: path.count(os.sep), reverse=True):
+        entries = children.pop(path)
+        entries.sort(key=lambda node: os.path.basename(node.path))
+        nodes[path] = node = FileTreeNode(entries, path, False)
+        if path != root:
+            children[os.path.dirname(path)].append(node)
+
+    return nodes[root]
+
+
+def create_file_tree_recursive(cwd, index : Index | None = None, ignore : IgnoreRules | None = None,
+                               store : ObjectStore | None = None):
+    '''
+        scour the current working directory
         and form the file tree
+
+        the walk is iterative, so deep trees do not hit the recursion limit
+
+        @param: index - stat cache, unchanged blobs reuse the cached hash instead of being read
+        @param: ignore - compiled ignore rules, ignored subtrees are never opened
+        @param: store - object store, blobs are hashed and stored in the same read
     '''
-    children = []
-    for child_file in os.listdir(cwd):
-        child_file_path = os.path.join(cwd, child_file)
+    dirs = list(walk_tree(cwd, ignore))
+    hashes = {}
+
+    if index is not None or store is not None:
+        for _, entries in dirs:
+            for entry in entries:
+                if entry.is_dir():
+                    continue
+
+                hashes[entry.path], _ = blob_hash(entry.path, entry.stat(), index, store)
+
+    return assemble_tree(cwd, dirs, hashes)
+
+
+def create_file_tree_parallel(cwd, index : Index | None = None, workers : int | None = None,
+                              use_processes : bool = False, ignore : IgnoreRules | None = None,
+                              store : ObjectStore | None = None):
+    '''
+        form the file tree of the current working directory by hashing blobs in parallel
+
+        the directory structure is walked first, the blobs are then hashed on a thread pool
+        (or a process pool for very large trees) and the directory nodes are assembled bottom-up
+        the root hash is the same as the one of create_file_tree_recursive
+
+        @param: index - stat cache, unchanged blobs reuse the cached hash instead of being read
+        @param: workers - size of the pool, defaults to the number of cpus
+        @param: use_processes - hash on a process pool instead of a thread pool
+        @param: ignore - compiled ignore rules, ignored subtrees are never opened
+        @param: store - object store, blobs are hashed and stored in the same read
+    '''
+    dirs = list(walk_tree(cwd, ignore))
+
+    hashes = {}
+    pending = []
+
+    for _, entries in dirs:
+        for entry in entries:
+            if entry.is_dir():
+                continue
+
+            st = entry.stat()
+            content_hash = cached_hash(entry.path, st, index, store)
+
+            if content_hash is None:
+                pending.append((entry.path, st))
+            else:
+                hashes[entry.path] = content_hash
+                record_hash(entry.path, st, content_hash, False, index)
+
+    if pending:
+        paths = [p for p, _ in pending]
+        executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+        workers = workers or os.cpu_count() or 1
+
+        # batch the tasks sent to worker processes to amortize the IPC
+        chunksize = max(1, len(paths) // (4 * workers)) if use_processes else 1
 
-        child_node = None
+        with executor_cls(max_workers=workers) as executor:
+            results = executor.map(read_hash, paths, [store] * len(paths), chunksize=chunksize)
 
-        if os.path.isfile(child_file_path):
-            child_node = FileTreeNode([], child_file_path, True)
-        elif os.path.isdir(child_file_path):
-            child_node = create_file_tree_recursive(child_file_path)
-        
-        if child_node is not None:
-            children.append(child_node)
+            # recorded here, the pool workers do not record anything
+            for (child_file_path, st), content_hash in zip(pending, results):
+                hashes[child_file_path] = content_hash
+                record_hash(child_file_path, st, content_hash, True, index)
 
-    node = FileTreeNode(children, cwd, False)
-    return node
+    return assemble_tree(cwd, dirs, hashes)
@@ -0,0 +1,205 @@
+'''
+    two stage hybrid diff
+
+    lines are diffed first with the LCS engine, only the replaced line hunks are refined
+        line level      - LCS over interned lines, equal lines are kept as they are
+        word level      - Myers over the word tokens of each replaced hunk
+        character level - Myers + Diffs.cleanup over each replaced word run
+
+    character level cost depends on the size of the changed regions, not on the size of the file
+
+    with a time budget hunks left when it runs out stay at line level and degraded is set
+'''
+
+import re
+import time
+
+from cache import DiffCache
+from diff import Diffs, Diff
+from lcs import LCS
+from myers import Myers
+from constants import EQUAL_OP, DELETION_OP, INSERTION_OP
+
+# words, runs of whitespace and single punctuation characters
+TOKEN_RE = re.compile(r'\w+|\s+|[^\w\s]')
+
+
+def split_lines(s : str) -> list[str]:
+    '''
+        split the text on '\\n' like LCS does, keeping the line endings
+
+        @returns: lines where ''.join(lines) == s and len(lines) == len(s.split('\\n'))
+    '''
+    lines = s.split('\n')
+    return [line + '\n' for line in lines[:-1]] + [lines[-1]]
+
+
+class HybridDiff:
+    '''
+        line level diff refined to character level inside the replaced hunks
+    '''
+    def __init__(self, s1 : str, s2 : str, bit_parallel : bool = True,
+                 timeout : float | None = None, max_d : int | None = None,
+                 cache : DiffCache | None = None) -> None:
+        '''
+            @param: s1 - initial text
+            @param: s2 - final text
+            @param: bit_parallel - use the bit-vector LCS kernel for the line stage
+            @param: timeout - time budget in seconds shared by all stages
+            @param: max_d - largest edit distance searched for by each Myers run
+            @param: cache - diff result cache, degraded results are not cached
+        '''
+        self.s1, self.s2 = s1, s2
+
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.max_d = max_d
+
+        self.degraded = False
+
+        key = None
+        if cache is not None:
+            key = cache.text_key(s1, s2, 'hybrid', 'c', {'cleanup': 'semantic'})
+            self.diffs = cache.get(key)
+            if self.diffs is not None:
+                return
+
+        self.lcs = LCS(s1, s2, bit_parallel, timeout)
+
+        self.diffs = Diffs([])
+        for old, new in self.line_hunks():
+            if old == new:
+                self.diffs.diffs.append(Diff(EQUAL_OP, old, new))
+            elif not new:
+                self.diffs.diffs.append(Diff(DELETION_OP, old, None))
+            elif not old:
+                self.diffs.diffs.append(Diff(INSERTION_OP, None, new))
+            elif self.remaining() == 0:
+                # line level fallback
+                self.degraded = True
+                self.diffs.diffs.append(Diff(DELETION_OP, old, None))
+                self.diffs.diffs.append(Diff(INSERTION_OP, None, new))
+            else:
+                self.diffs.diffs.extend(self.refine(self.word_diff(old, new)))
+
+        self.degraded = self.degraded or self.lcs.degraded
+        self.diffs.cleanup_merge()
+
+        if cache is not None and key is not None and not self.degraded:
+            cache.put(key, self.diffs)
+
+    def remaining(self) -> float | None:
+        '''
+            @returns: seconds left of the time budget, None without a budget
+        '''
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def myers(self, s1 : str, s2 : str) -> Diffs:
+        '''
+            character level Myers within the remaining budget
+
+            @returns: cleaned up diffs
+        '''
+        myers = Myers(s1, s2, linear=True, verbose=False, timeout=self.remaining(), max_d=self.max_d)
+        self.degraded = self.degraded or myers.degraded
+
+        return myers.diffs
+
+    def line_hunks(self):
+        '''
+            walks the line level LCS
+
+            matched lines that only differ in their line endings are treated as replaced
+
+            @yields: (old text, new text) - equal for matched lines, different for replaced hunks
+        '''
+        lines1, lines2 = split_lines(self.s1), split_lines(self.s2)
+        matches = self.lcs.compute_lcs(0, len(self.lcs.a), 0, len(self.lcs.b))
+        matches.append((len(lines1), len(lines2)))
+
+        # start of the pending replaced hunk in both texts
+        hunk_i, hunk_j = 0, 0
+
+        for i, j in matches:
+            if i < len(lines1) and lines1[i] == lines2[j]:
+                if hunk_i < i or hunk_j < j:
+                    yield ''.join(lines1[hunk_i:i]), ''.join(lines2[hunk_j:j])
+                yield lines1[i], lines2[j]
+                hunk_i, hunk_j = i + 1, j + 1
+
+        if hunk_i < len(lines1) or hunk_j < len(lines2):
+            yield ''.join(lines1[hunk_i:]), ''.join(lines2[hunk_j:])
+
+    def word_diff(self, old : str, new : str) -> Diffs:
+        '''
+            Myers over word tokens, every distinct token is interned to a single character
+            so the character engine can be reused as is
+
+            @returns: word level Diffs of the hunk
+        '''
+        tokens = {}
+        words = []
+
+        def intern(s : str) -> str:
+            out = []
+            for token in TOKEN_RE.findall(s):
+                if token not in tokens:
+                    tokens[token] = chr(len(words))
+                    words.append(token)
+                out.append(tokens[token])
+            return ''.join(out)
+
+        diffs = []
+        for d in self.myers(intern(old), intern(new)).diffs:
+            text = ''.join(words[ord(ch)] for ch in d.diff_str)
+            if d.op == EQUAL_OP:
+                diffs.append(Diff(EQUAL_OP, text, text))
+            elif d.op == DELETION_OP:
+                diffs.append(Diff(DELETION_OP, text, None))
+            else:
+                diffs.append(Diff(INSERTION_OP, None, text))
+
+        word_diffs = Diffs(diffs, level='w')
+        word_diffs.cleanup_merge()
+
+        return word_diffs
+
+    def refine(self, word_diffs : Diffs) -> list[Diff]:
+        '''
+            character level Myers and cleanup over each deletion / insertion pair of the word diff
+
+            @returns: character level diffs of the hunk
+        '''
+        diffs = []
+        pending = None
+
+        for d in word_diffs.diffs:
+            if d.op == INSERTION_OP and pending is not None:
+                diffs.extend(self.myers(pending.old_str, d.new_str).diffs)
+                pending = None
+                continue
+
+            if pending is not None:
+                diffs.append(pending)
+                pending = None
+
+            if d.op == DELETION_OP:
+                pending = d
+            else:
+                diffs.append(d)
+
+        if pending is not None:
+            diffs.append(pending)
+
+        return diffs
+
+    def __repr__(self) -> str:
+        return repr(self.diffs)
+
+
+if __name__ == '__main__':
+    text_1 = open("./test/file_1.txt").read()
+    text_2 = open("./test/file_2.txt").read()
+
+    print(HybridDiff(text_1, text_2))
@@ -0,0 +1,153 @@
+'''
+    gitignore style ignore rules read from .minigitignore
+
+    supported syntax
+        - blank lines and lines starting with '#' are skipped
+        - '!' negates a pattern
+        - a trailing '/' matches directories only
+        - a pattern containing '/' (other than a trailing one) is anchored at the root
+        - '*', '?', '[...]' and '**' wildcards
+'''
+
+import re
+
+
+def translate_pattern(pattern : str) -> str:
+    '''
+        translate a single gitignore glob (without negation / trailing slash) to a regex
+        matching paths relative to the root, separated by '/'
+    '''
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    parts = []
+    i, n = 0, len(pattern)
+
+    while i < n:
+        ch = pattern[i]
+
+        if pattern.startswith('**', i):
+            at_start = i == 0 or pattern[i - 1] == '/'
+            if at_start and pattern.startswith('**/', i):
+                # leading or inner '**/' matches zero or more directories
+                parts.append('(?:.*/)?')
+                i += 3
+                continue
+            if at_start and i + 2 == n:
+                # trailing '/**' matches everything inside
+                parts.append('.*')
+                i += 2
+                continue
+            parts.append('[^/]*')
+            i += 2
+        elif ch == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif ch == '?':
+            parts.append('[^/]')
+            i += 1
+        elif ch == '[':
+            start = i + 1
+            if start < n and pattern[start] in '!^':
+                start += 1
+            if start < n and pattern[start] == ']':
+                start += 1
+
+            j = pattern.find(']', start)
+            if j == -1:
+                parts.append(re.escape(ch))
+                i += 1
+                continue
+            body = pattern[i + 1:j]
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = j + 1
+        else:
+            parts.append(re.escape(ch))
+            i += 1
+
+    rx = ''.join(parts)
+
+    if anchored:
+        return '^' + rx + '$'
+    return '^(?:.*/)?' + rx + '$'
+
+
+class IgnoreRules:
+    '''
+        compiled set of ignore patterns
+
+        without negated patterns all rules are merged into a single regex,
+        otherwise the last matching rule decides like in git
+    '''
+    def __init__(self, patterns : list[str]) -> None:
+        '''
+            @param: patterns - lines of an ignore file
+        '''
+        # (compiled regex, negate, directory only)
+        self.rules = []
+
+        for line in patterns:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                line = line[1:]
+
+            line = line.rstrip(' ')
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            self.rules.append((re.compile(translate_pattern(line)), negate, dir_only))
+
+        self.has_negation = any(negate for _, negate, _ in self.rules)
+
+        self.file_rx = self.merge([rx for rx, _, dir_only in self.rules if not dir_only])
+        self.dir_rx = self.merge([rx for rx, _, _ in self.rules])
+
+    @staticmethod
+    def merge(rules : list) -> re.Pattern | None:
+        '''
+            @returns: a single regex matching if any of the rules match
+        '''
+        if not rules:
+            return None
+        return re.compile('|'.join('(?:' + rx.pattern + ')' for rx in rules))
+
+    @classmethod
+    def from_file(cls, path : str) -> "IgnoreRules":
+        '''
+            @param: path - location of the ignore file, a missing file yields no rules
+        '''
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(f.readlines())
+        except FileNotFoundError:
+            return cls([])
+
+    def is_ignored(self, rel_path : str, is_dir : bool) -> bool:
+        '''
+            @param: rel_path - path relative to the root, separated by '/'
+            @param: is_dir - whether the path is a directory
+
+            @returns: True if the path is excluded
+        '''
+        if not self.has_negation:
+            rx = self.dir_rx if is_dir else self.file_rx
+            return rx is not None and rx.match(rel_path) is not None
+
+        for rx, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if rx.match(rel_path) is not None:
+                return not negate
+
+        return False
+
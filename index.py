@@ -0,0 +1,138 @@
+'''
+    implementation of the minigit index
+
+    caches stat data and the id of every blob so that unchanged files
+    are not read again while building the file tree
+'''
+
+import os
+import struct
+
+INDEX_SIGNATURE = b'MGIX'
+# entries of older versions hold untyped blob ids
+INDEX_VERSION = 2
+
+# signature, version, number of entries
+INDEX_HEADER = struct.Struct('>4sII')
+
+# size, mtime_ns, inode, raw sha1, length of path
+INDEX_ENTRY = struct.Struct('>QqQ20sH')
+
+
+class Index:
+    '''
+        on disk stat cache of the working directory blobs
+
+        an entry is trusted only if size, mtime and inode of the file are unchanged
+        and the file was not modified in the same timestamp tick the index was written in (racy entry)
+    '''
+    def __init__(self, path : str) -> None:
+        '''
+            @param: path - location of the index file (usually .minigit/index)
+        '''
+        self.path = path
+
+        # path -> (size, mtime_ns, inode, content hash)
+        self.entries = {}
+        self.updated = {}
+
+        # mtime of the index file when it was loaded
+        self.timestamp = 0
+
+    def load(self) -> None:
+        '''
+            read the index file if it exists
+            a corrupt or outdated index is discarded
+        '''
+        self.entries = {}
+
+        try:
+            with open(self.path, 'rb') as f:
+                self.timestamp = os.fstat(f.fileno()).st_mtime_ns
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        try:
+            signature, version, count = INDEX_HEADER.unpack_from(data, 0)
+            if signature != INDEX_SIGNATURE or version != INDEX_VERSION:
+                return
+
+            entries = {}
+            pos = INDEX_HEADER.size
+
+            for _ in range(count):
+                size, mtime_ns, inode, digest, path_len = INDEX_ENTRY.unpack_from(data, pos)
+                pos += INDEX_ENTRY.size
+                path = data[pos:pos + path_len].decode('utf-8', 'surrogateescape')
+                pos += path_len
+
+                entries[path] = (size, mtime_ns, inode, digest.hex())
+        except struct.error:
+            return
+
+        self.entries = entries
+
+    def save(self) -> None:
+        '''
+            write the entries updated since loading to the index file
+            the file is replaced atomically
+        '''
+        parts = [INDEX_HEADER.pack(INDEX_SIGNATURE, INDEX_VERSION, len(self.updated))]
+
+        for path, (size, mtime_ns, inode, content_hash) in self.updated.items():
+            encoded_path = path.encode('utf-8', 'surrogateescape')
+            parts.append(INDEX_ENTRY.pack(size, mtime_ns, inode, bytes.fromhex(content_hash), len(encoded_path)))
+            parts.append(encoded_path)
+
+        tmp_path = self.path + '.lock'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(parts))
+
+        os.replace(tmp_path, self.path)
+
+        self.entries = self.updated
+        self.updated = {}
+        self.timestamp = os.stat(self.path).st_mtime_ns
+
+    def lookup(self, path : str, st : os.stat_result) -> str | None:
+        '''
+            @param: path - path of the blob
+            @param: st - current stat data of the blob
+
+            @returns: cached content hash if the blob is unchanged, None otherwise
+        '''
+        entry = self.entries.get(path)
+
+        if entry is None:
+            return None
+
+        size, mtime_ns, inode, content_hash = entry
+
+        if size != st.st_size or mtime_ns != st.st_mtime_ns or inode != st.st_ino:
+            return None
+
+        # racy entry: the file may have changed again after it was hashed
+        # without its mtime changing, so the digest can not be trusted
+        if mtime_ns >= self.timestamp:
+            return None
+
+        return content_hash
+
+    def keep(self, path : str) -> str:
+        '''
+            carry an entry over unchanged, for blobs known to be untouched without a stat
+
+            @returns: cached content hash of the blob
+        '''
+        self.updated[path] = entry = self.entries[path]
+
+        return entry[3]
+
+    def update(self, path : str, st : os.stat_result, content_hash : str) -> None:
+        '''
+            record stat data and content hash of a blob
+
+            @param: st - stat data taken before the blob was hashed
+        '''
+        self.updated[path] = (st.st_size, st.st_mtime_ns, st.st_ino, content_hash)
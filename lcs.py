@@ -6,92 +6,216 @@
     see paper: https://dl.acm.org/doi/pdf/10.1145/360825.360861
 '''
 
+import time
+from itertools import accumulate
+
+import stats
+from cache import DiffCache
 from diff import Diffs, Diff
 from constants import EQUAL_OP, DELETION_OP, INSERTION_OP
 
+# rows of the LCS recurrence computed between two checks of the deadline
+DEADLINE_ROWS = 64
+
 class LCS:
     '''
         implementation of LCS class for calculating line level diffs
 
         finds longest common subsequences of lines through naive approach
         modified lines in between common subsequences are reported as insertion / deletion pairs
+
+        with a time budget ranges that are not split in time are left unmatched and degraded is set,
+        the deadline is also checked while the rows of a split are computed
     '''
-    def __init__(self, s1: str, s2: str) -> None:
+    # name of the engine in diff cache keys
+    algorithm = 'lcs'
+
+    def __init__(self, s1: str, s2: str, bit_parallel: bool = False, timeout: float | None = None,
+                 cache: DiffCache | None = None) -> None:
         '''
             @params: s1 - initial text
             @params: s2 - final text
+            @params: bit_parallel - use the bit-vector kernel for the forward and reverse LCS rows
+            @params: timeout - time budget in seconds
+            @params: cache - diff result cache used by to_diff
         '''
+        self.s1, self.s2 = s1, s2
+        self.cache = cache
+
         self.l1 = [line.strip('\r') for line in s1.split('\n')]
         self.l2 = [line.strip('\r') for line in s2.split('\n')]
 
-        # print(self.l1)
-        # print(self.l2)
+        # intern lines into integer ids so that the inner loops compare ints instead of strings
+        ids = {}
+        self.a = [ids.setdefault(line, len(ids)) for line in self.l1]
+        self.b = [ids.setdefault(line, len(ids)) for line in self.l2]
 
-    def compute_lcs_size(self, l1: list[str], l2: list[str]) -> list:
+        self.lcs_size = self.compute_lcs_size_bits if bit_parallel else self.compute_lcs_size
+
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.degraded = False
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def compute_lcs_size(self, x0: int, x1: int, y0: int, y1: int, reverse: bool = False) -> list[int] | None:
         '''
-            implements naive exact LCS solution
-            time complexity:  O(len(s1) * len(s2))
-            space complexity: O(len(s1))
+            implements naive exact LCS solution on a[x0:x1] and b[y0:y1]
+            time complexity:  O(n1 * n2)
+            space complexity: O(n2)
 
-            @returns: L[n1, :]
+            @param: reverse - run the recurrence from the ends of both ranges
+
+            @returns: L where L[j] is the LCS size of a[x0:x1] with b[y0:y0 + j]
+                      (with b[y1 - j:y1] if reverse), None if the deadline passed
         '''
-        n1, n2 = len(l1), len(l2)
+        a, b = self.a, self.b
+        n2 = y1 - y0
+
+        if stats.active is not None:
+            stats.active.add('lcs.rows', x1 - x0)
+            stats.active.add('lcs.cells', (x1 - x0) * n2)
+
+        rows = range(x1 - 1, x0 - 1, -1) if reverse else range(x0, x1)
+        cols = range(y1 - 1, y0 - 1, -1) if reverse else range(y0, y1)
 
         prev = [0] * (n2 + 1)
-        curr = [0] * (n2 + 1)
 
-        for i in range(1, n1 + 1):
-            for j in range(1, n2 + 1):
-                if l1[i - 1] == l2[j - 1]:
-                    curr[j] = 1 + prev[j - 1]
-                else:
-                    curr[j] = max(curr[j - 1], prev[j])
+        for row, i in enumerate(rows):
+            if row % DEADLINE_ROWS == 0 and self.out_of_time():
+                return None
 
-            prev = curr.copy()
+            ai = a[i]
+            curr = [0] * (n2 + 1)
+            left = 0
 
-        return curr[1:]
-    
-    def compute_lcs(self, l1: list[str], l2: list[str], n1: int, n2: int, \
-                    p1: int = 0, p2: int = 0) -> list[tuple]:
+            for j, bj in enumerate(cols, 1):
+                if ai == b[bj]:
+                    left = prev[j - 1] + 1
+                elif prev[j] > left:
+                    left = prev[j]
+                curr[j] = left
+
+            prev = curr
+
+        return prev
+
+    def compute_lcs_size_bits(self, x0: int, x1: int, y0: int, y1: int, reverse: bool = False) -> list[int] | None:
+        '''
+            bit-parallel LCS (Allison-Dix / Hyyro) on a[x0:x1] and b[y0:y1]
+            a whole row of the DP is processed at once as a python big int
+
+            bit j of V is 0 iff L[j + 1] - L[j] == 1, so the row is the prefix count of zero bits
+            time complexity:  O(n1 * n2 / w)
+            space complexity: O(n2)
+
+            @returns: same row as compute_lcs_size
+        '''
+        a, b = self.a, self.b
+        n2 = y1 - y0
+
+        if stats.active is not None:
+            stats.active.add('lcs.rows', x1 - x0)
+            stats.active.add('lcs.cells', (x1 - x0) * n2)
+
+        rows = range(x1 - 1, x0 - 1, -1) if reverse else range(x0, x1)
+        cols = range(y1 - 1, y0 - 1, -1) if reverse else range(y0, y1)
+
+        # match masks: bit j set where the j-th line of the (possibly reversed) range equals the id
+        masks = {}
+        for j, bj in enumerate(cols):
+            masks[b[bj]] = masks.get(b[bj], 0) | (1 << j)
+
+        full = (1 << n2) - 1
+        V = full
+
+        for row, i in enumerate(rows):
+            if row % DEADLINE_ROWS == 0 and self.out_of_time():
+                return None
+
+            U = V & masks.get(a[i], 0)
+            V = ((V + U) | (V - U)) & full
+
+        bits = format(V, f'0{n2}b')[::-1] if n2 else ''
+
+        return list(accumulate((bit == '0' for bit in bits), initial=0))
+
+    def compute_lcs(self, x0: int, x1: int, y0: int, y1: int, depth: int = 0) -> list[tuple]:
         '''
-            recursively enumerates the actual longest common subsequence
+            recursively enumerates the actual longest common subsequence of a[x0:x1] and b[y0:y1]
             from the lcs size algorithm
 
+            common prefix and suffix are matched directly before splitting
+
+            @param: depth - recursion depth of the call
+
             @returns: list of matches as tuples
         '''
+        a, b = self.a, self.b
+
+        if stats.active is not None:
+            stats.active.add('lcs.calls')
+            stats.active.peak('lcs.depth', depth)
+
+        prefix = []
+        while x0 < x1 and y0 < y1 and a[x0] == b[y0]:
+            prefix.append((x0, y0))
+            x0, y0 = x0 + 1, y0 + 1
+
+        suffix = []
+        while x0 < x1 and y0 < y1 and a[x1 - 1] == b[y1 - 1]:
+            x1, y1 = x1 - 1, y1 - 1
+            suffix.append((x1, y1))
+        suffix.reverse()
+
+        n1, n2 = x1 - x0, y1 - y0
+
         # Handle edge cases
-        if n2 == 0:
-            return []
+        if n1 == 0 or n2 == 0:
+            middle = []
         elif n1 == 1:
-            for j in range(n2):
-                if l1[0] == l2[j]:
-                    return [(p1, p2 + j)]
-            return []
+            middle = []
+            for j in range(y0, y1):
+                if a[x0] == b[j]:
+                    middle = [(x0, j)]
+                    break
         else:
             # Evaluate L[i, j] and L*[i, j] for j = 0,...,n2
-            i = n1 // 2
+            i = x0 + n1 // 2
 
-            L = self.compute_lcs_size(l1[:i], l2)
-            L_c = self.compute_lcs_size(l1[-1:i - 1:-1], l2[::-1])
+            L = self.lcs_size(x0, i, y0, y1) if not self.out_of_time() else None
+            L_c = self.lcs_size(i, x1, y0, y1, reverse=True) if L is not None else None
 
-            k, M = 0, 0
+            if L is None or L_c is None:
+                # out of budget, the range is reported as replaced
+                self.degraded = True
+                return prefix + suffix
 
-            for j in range(n2):
-                if L[j] + L_c[n2 - j - 1] > M:
-                    M = L[j] + L_c[n2 - j - 1]
+            k, M = 0, -1
+
+            for j in range(n2 + 1):
+                if L[j] + L_c[n2 - j] > M:
+                    M = L[j] + L_c[n2 - j]
                     k = j
 
-            C1 = self.compute_lcs(l1[:i], l2[:k + 1], i, k + 1, p1 + 0, p2 + 0)
-            C2 = self.compute_lcs(l1[i:], l2[k + 1:], n1 - i, n2 - k - 1, p1 + i, p2 + k + 1)
-            
-            return C1 + C2
+            middle = self.compute_lcs(x0, i, y0, y0 + k, depth + 1) + self.compute_lcs(i, x1, y0 + k, y1, depth + 1)
+
+        return prefix + middle + suffix
 
     
     def to_diff(self) -> Diffs:
         '''
             converts inter-match sequences to subsequent insertions and deletions
+            degraded results are not cached
         '''
-        lcs = self.compute_lcs(self.l1, self.l2, len(self.l1), len(self.l2))
+        key = None
+        if self.cache is not None:
+            key = self.cache.text_key(self.s1, self.s2, self.algorithm, 'l')
+            self.diffs = self.cache.get(key)
+            if self.diffs is not None:
+                return self.diffs
+
+        lcs = self.compute_lcs(0, len(self.a), 0, len(self.b))
 
         # fill in inter-LCS contiguous unmatched sequences using insertions and deletions
         last_i, last_j = -1, -1
@@ -116,6 +240,9 @@ class LCS:
 
         self.diffs = Diffs(self.diffs)
 
+        if self.cache is not None and key is not None and not self.degraded:
+            self.cache.put(key, self.diffs)
+
         return self.diffs
 
 
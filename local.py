@@ -10,7 +10,14 @@
 
 import os
 
-from filetree import create_file_tree_recursive
+from cache import DiffCache
+from constants import MINIGIT_DIR, IGNORE_FILE, OBJECTS_DIR, CACHE_DIR
+from filetree import create_file_tree_recursive, create_file_tree_parallel
+from ignore import IgnoreRules
+from index import Index
+from objects import ObjectStore
+from snapshot import SNAPSHOT_FILE, Snapshot, write_snapshot
+from watch import ChangeJournal, Watcher, create_file_tree_tracked
 
 class Local:
     '''
@@ -19,18 +26,98 @@ class Local:
 
     def __init__(self) -> None:
         self.working_dir = os.getcwd()
-        self.local_dir = os.path.join(self.working_dir, '.minigit')
+        self.local_dir = os.path.join(self.working_dir, MINIGIT_DIR)
+        self.index_path = os.path.join(self.local_dir, 'index')
+        self.objects_dir = os.path.join(self.local_dir, OBJECTS_DIR)
+        self.cache_dir = os.path.join(self.local_dir, CACHE_DIR)
+        self.snapshot_path = os.path.join(self.local_dir, SNAPSHOT_FILE)
 
     def create_repo(self) -> None:
         '''
             - create necessary folder structure for minigit
             - generate file blobs
             - create file tree
+
+            unchanged blobs and trees already in the object store are not rewritten
         '''
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        store = ObjectStore(self.objects_dir)
+
+        self.create_file_tree(store=store)
+        store.write_tree(self.file_tree_root)
 
-    def create_file_tree(self) -> None:
+    def create_file_tree(self, parallel : bool = False, workers : int | None = None,
+                         store : ObjectStore | None = None) -> None:
         '''
             create a file tree object
             save the root node
+
+            paths matched by .minigitignore are skipped
+            blobs whose stat data matches the index are not rehashed
+            with a running watcher only the paths it recorded are stat'ed
+            the index and the tree snapshot are refreshed if the repo exists
+
+            @param: parallel - hash blobs on a thread pool
+            @param: workers - size of the thread pool
+            @param: store - object store the blobs are written to while hashing
+        '''
+        index = Index(self.index_path)
+        index.load()
+
+        ignore = IgnoreRules.from_file(os.path.join(self.working_dir, IGNORE_FILE))
+
+        journal = ChangeJournal(self.local_dir)
+
+        if journal.watcher_alive():
+            self.file_tree_root = create_file_tree_tracked(self.working_dir, journal, index, ignore, store)
+        elif parallel:
+            self.file_tree_root = create_file_tree_parallel(self.working_dir, index, workers, ignore=ignore, store=store)
+        else:
+            self.file_tree_root = create_file_tree_recursive(self.working_dir, index, ignore, store)
+
+        if os.path.isdir(self.local_dir):
+            index.save()
+            journal.done()
+            self.save_snapshot()
+
+    def save_snapshot(self) -> None:
+        '''
+            write the snapshot of the file tree unless the stored one has the same root hash
+        '''
+        if os.path.exists(self.snapshot_path):
+            snapshot = Snapshot(self.snapshot_path)
+            try:
+                unchanged = snapshot.digest(0) == self.file_tree_root.content_hash
+            finally:
+                snapshot.close()
+            if unchanged:
+                return
+
+        write_snapshot(self.file_tree_root, self.snapshot_path)
+
+    def load_snapshot(self) -> bool:
+        '''
+            use the stored tree snapshot as the file tree, without walking the working directory
+            the tree is read-only and reflects the working directory as of the last create_file_tree
+
+            @returns: False if there is no snapshot
+        '''
+        if not os.path.exists(self.snapshot_path):
+            return False
+
+        self.file_tree_root = Snapshot(self.snapshot_path).root
+        return True
+
+    def watch(self) -> None:
+        '''
+            run the change tracker of the working directory until interrupted
+        '''
+        ignore = IgnoreRules.from_file(os.path.join(self.working_dir, IGNORE_FILE))
+        Watcher(self.working_dir, ChangeJournal(self.local_dir), ignore).run()
+
+    def diff_cache(self) -> DiffCache:
+        '''
+            @returns: diff result cache backed by .minigit/cache
         '''
-        self.file_tree_root = create_file_tree_recursive(self.working_dir)
+        return DiffCache(self.cache_dir)
@@ -0,0 +1,156 @@
+'''
+    diff3 style three-way merge of line based texts
+
+    base -> ours and base -> theirs are diffed once each with the LCS line engine,
+    the matches are turned into base line -> side line maps and the three texts are
+    walked together in a single sweep
+        - a base line matched on both sides is stable and taken as is
+        - the lines up to the next stable line form an unstable chunk, taken from the
+          side that changed it, from either side if both changed it the same way,
+          and reported as a conflict otherwise
+
+    besides the two diffs the merge is linear in the size of the texts
+'''
+
+from typing import NamedTuple
+
+from constants import UNCHANGED, OURS, THEIRS, BOTH, CONFLICT
+from lcs import LCS
+
+CONFLICT_START = '<<<<<<<'
+CONFLICT_BASE = '|||||||'
+CONFLICT_SEPARATOR = '======='
+CONFLICT_END = '>>>>>>>'
+
+
+class MergeRegion(NamedTuple):
+    '''
+        consecutive lines of the merge, as [start, end) line ranges of each text
+    '''
+    kind : str
+    base : tuple[int, int]
+    ours : tuple[int, int]
+    theirs : tuple[int, int]
+
+
+class ThreeWayMerge:
+    '''
+        three-way merge of ours and theirs, two versions derived from base
+    '''
+    def __init__(self, base : str, ours : str, theirs : str, engine : type[LCS] = LCS, **options) -> None:
+        '''
+            @param: engine - line diff engine, LCS or a subclass of it (e.g. Patience)
+            @param: options - passed on to the engine, e.g. bit_parallel / timeout
+        '''
+        self.base = base.split('\n')
+        self.ours = ours.split('\n')
+        self.theirs = theirs.split('\n')
+
+        ours_map, ours_degraded = self.match(engine(base, ours, **options))
+        theirs_map, theirs_degraded = self.match(engine(base, theirs, **options))
+
+        # some lines may have been left unmatched, see LCS
+        self.degraded = ours_degraded or theirs_degraded
+
+        self.regions = self.sweep(ours_map, theirs_map)
+
+    @staticmethod
+    def match(lcs : LCS) -> tuple[list[int], bool]:
+        '''
+            @returns: (line of the other text matched to each base line or -1, degraded)
+                      the list has an extra entry matching the ends of both texts
+        '''
+        line_map = [-1] * len(lcs.a) + [len(lcs.b)]
+        for i, j in lcs.compute_lcs(0, len(lcs.a), 0, len(lcs.b)):
+            line_map[i] = j
+
+        return line_map, lcs.degraded
+
+    def sweep(self, ours_map : list[int], theirs_map : list[int]) -> list[MergeRegion]:
+        '''
+            walks the three texts from stable line to stable line
+
+            @returns: merge regions in order, consecutive stable lines form one region
+        '''
+        regions = []
+        n = len(self.base)
+        i = j = k = 0
+
+        while True:
+            i1 = i
+            while ours_map[i1] < 0 or theirs_map[i1] < 0:
+                i1 += 1
+            j1, k1 = ours_map[i1], theirs_map[i1]
+
+            if i1 > i or j1 > j or k1 > k:
+                regions.append(MergeRegion(self.resolve(i, i1, j, j1, k, k1), (i, i1), (j, j1), (k, k1)))
+
+            if i1 == n:
+                return regions
+
+            last = regions[-1] if regions else None
+            if last is not None and last.kind == UNCHANGED and last.base[1] == i1:
+                regions[-1] = MergeRegion(UNCHANGED, (last.base[0], i1 + 1), (last.ours[0], j1 + 1), (last.theirs[0], k1 + 1))
+            else:
+                regions.append(MergeRegion(UNCHANGED, (i1, i1 + 1), (j1, j1 + 1), (k1, k1 + 1)))
+
+            i, j, k = i1 + 1, j1 + 1, k1 + 1
+
+    def resolve(self, i0 : int, i1 : int, j0 : int, j1 : int, k0 : int, k1 : int) -> str:
+        '''
+            @returns: kind of the unstable chunk base[i0:i1] / ours[j0:j1] / theirs[k0:k1]
+        '''
+        base = self.base[i0:i1]
+        ours_changed = j1 - j0 != i1 - i0 or self.ours[j0:j1] != base
+        theirs_changed = k1 - k0 != i1 - i0 or self.theirs[k0:k1] != base
+
+        if not ours_changed:
+            return THEIRS if theirs_changed else UNCHANGED
+        if not theirs_changed:
+            return OURS
+        if j1 - j0 == k1 - k0 and self.ours[j0:j1] == self.theirs[k0:k1]:
+            return BOTH
+
+        return CONFLICT
+
+    @property
+    def conflicts(self) -> int:
+        return sum(region.kind == CONFLICT for region in self.regions)
+
+    def merged(self, ours_label : str = 'ours', theirs_label : str = 'theirs', base_label : str | None = None) -> str:
+        '''
+            @param: base_label - also show the base lines of conflicts (diff3 style) under this label
+
+            @returns: merged text, conflicts are wrapped in conflict markers
+        '''
+        lines = []
+
+        for kind, (i0, i1), (j0, j1), (k0, k1) in self.regions:
+            if kind == THEIRS:
+                lines.extend(self.theirs[k0:k1])
+            elif kind != CONFLICT:
+                lines.extend(self.ours[j0:j1])
+            else:
+                lines.append(f'{CONFLICT_START} {ours_label}')
+                lines.extend(self.ours[j0:j1])
+                if base_label is not None:
+                    lines.append(f'{CONFLICT_BASE} {base_label}')
+                    lines.extend(self.base[i0:i1])
+                lines.append(CONFLICT_SEPARATOR)
+                lines.extend(self.theirs[k0:k1])
+                lines.append(f'{CONFLICT_END} {theirs_label}')
+
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import sys
+
+    texts = []
+    for path in sys.argv[1:4]:
+        with open(path) as f:
+            texts.append(f.read())
+
+    merge = ThreeWayMerge(*texts)
+    sys.stdout.write(merge.merged(sys.argv[2], sys.argv[3], sys.argv[1]))
+    sys.exit(1 if merge.conflicts else 0)
@@ -6,47 +6,154 @@
 __author__ = 'Arka'
 
 
-from diff import Diff, Diffs
+import time
+
+import stats
+from cache import DiffCache
+from diff import Diffs, EditScript
 from constants import EQUAL_OP, DELETION_OP, INSERTION_OP
+from utils import half_match
+
+# levels of the edit graph trace_path keeps at once before bisecting further
+TRACE_LEVELS = 32
 
 class Myers:
     '''
         implementation of Myers diff algorithm at character level
 
         produces a patch to convert string defined by s1 to string defined by s2 
+
+        the linear space variant follows the same path through the edit graph as the trace
+        variant, so both give the same diffs
+
+        with a time or edit distance budget the search gives up on ranges it can not finish
+        in budget, they are split on a half match or replaced wholesale and degraded is set
+
+        with a cache the cleaned up diffs of a pair are computed once, edits is None on a hit
+        degraded results are never cached
     '''
-    def __init__(self, s1 : str, s2 : str) -> None:
+    def __init__(self, s1 : str, s2 : str, linear : bool = False, verbose : bool = True,
+                 timeout : float | None = None, max_d : int | None = None,
+                 cache : DiffCache | None = None) -> None:
         '''
             @input: s1 - initial text
             @input: s2 - final text
+            @input: linear - use the linear space (middle snake) variant of the algorithm
+            @input: verbose - print the diff table
+            @input: timeout - time budget in seconds
+            @input: max_d - largest edit distance searched for
+            @input: cache - diff result cache
         '''
         self.s1, self.s2 = s1, s2
-        self.edit_graph_trace = self.shortest_edit()
 
-        self.edit_patches = self.backtrack()
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.max_d = max_d
+        self.degraded = False
 
-        self.edits = []
-        for prev_pos, next_pos in self.edit_patches:
-            if prev_pos[0] == next_pos[0]:
-                diff = Diff(INSERTION_OP, None, self.s2[prev_pos[1]])
-            elif prev_pos[1] == next_pos[1]:
-                diff = Diff(DELETION_OP, self.s1[prev_pos[0]], None)
-            else:
-                diff = Diff(EQUAL_OP, self.s2[prev_pos[1]], self.s1[prev_pos[0]])
+        self.edits = None
+        self.diffs = None
+
+        key = None
+        if cache is not None:
+            key = cache.text_key(s1, s2, 'myers', 'c', {'linear': linear, 'cleanup': 'semantic'})
+            self.diffs = cache.get(key)
+
+        if self.diffs is None:
+            self.diffs = self.diff(linear)
+
+            if cache is not None and key is not None and not self.degraded:
+                cache.put(key, self.diffs)
+
+        if verbose:
+            print(self.diffs)
+
+    def diff(self, linear : bool) -> Diffs:
+        '''
+            computes the edit script and converts it to cleaned up diffs
+
+            @returns: character level diffs
+        '''
+        if not linear:
+            self.edit_graph_trace = self.shortest_edit()
+
+        if linear:
+            self.edits = self.linear_edit()
+        elif self.edit_graph_trace is None:
+            # out of budget, degrade range by range
+            self.edits = self.bisect_edit()
+        else:
+            self.edit_patches = self.backtrack()
+
+            self.edits = EditScript(self.s1, self.s2)
+            for prev_pos, next_pos in self.edit_patches:
+                if prev_pos[0] == next_pos[0]:
+                    self.edits.append(INSERTION_OP, prev_pos[0], prev_pos[1])
+                elif prev_pos[1] == next_pos[1]:
+                    self.edits.append(DELETION_OP, prev_pos[0], prev_pos[1])
+                else:
+                    self.edits.append(EQUAL_OP, prev_pos[0], prev_pos[1])
+
+        if stats.active is not None:
+            self.record(stats.active)
 
-            self.edits.append(diff)
+        diffs = self.edits.to_diffs()
+        diffs.cleanup()
 
-        self.diffs = Diffs(self.edits)
+        return diffs
 
-        self.diffs.cleanup()
+    def record(self, collection : stats.Stats) -> None:
+        '''
+            records the edit distance and the snakes of the edit script
+        '''
+        snakes = [length for code, length in zip(self.edits.ops, self.edits.lengths) if code == 0]
+
+        collection.add('myers.calls')
+        collection.add('myers.d', self.edits.edit_distance())
+        collection.add('myers.snakes', len(snakes))
+        collection.add('myers.snake_chars', sum(snakes))
+        collection.peak('myers.longest_snake', max(snakes, default=0))
+        if self.degraded:
+            collection.add('myers.degraded')
+
+    def out_of_budget(self, d : int) -> bool:
+        '''
+            @param: d - lower bound of the edit distance still being searched for
+
+            @returns: True if the search has to give up
+        '''
+        if self.max_d is not None and d > self.max_d:
+            return True
+
+        return self.deadline is not None and time.monotonic() > self.deadline
 
-        print(self.diffs)
+    def previous_diagonal(self, v : list, k : int, d : int, n1 : int, n2 : int, offset : int = 0) -> int | None:
+        '''
+            picks the diagonal from which the furthest reaching d-path on diagonal k is extended
+            moves leaving the edit graph are discarded
+
+            @param: v - furthest reaching x of the (d-1)-paths, -1 for unreachable diagonals
+            @param: offset - index of diagonal 0 in v
+
+            @returns: k + 1 (insertion) / k - 1 (deletion) / None if diagonal k can not be reached
+        '''
+        x_down = v[offset + k + 1] if k != d else -1
+        x_right = v[offset + k - 1] + 1 if k != -d and v[offset + k - 1] != -1 else -1
+
+        if x_down - k > n2:
+            x_down = -1
+        if x_right > n1:
+            x_right = -1
+
+        if x_down == -1 and x_right == -1:
+            return None
+
+        return k + 1 if x_down >= x_right else k - 1
 
     def shortest_edit(self) -> list:
         '''
             constructs the k-v graph
 
-            @returns: list containing all the levels of the graph
+            @returns: list containing all the levels of the graph, None if out of budget
         '''
         n1, n2 = len(self.s1), len(self.s2)
 
@@ -54,23 +161,27 @@ class Myers:
         n = n1 + n2
 
         # k-d graph
-        v = [0] * (2 * n + 1)
-        v[0] = 0
+        v = [-1] * (2 * n + 2)
 
         # traces of the k-d graph
         v_trace = []
 
-        for d in range(1, n):
+        for d in range(0, n + 1):
+            if self.out_of_budget(d):
+                return None
+
             v_trace.append(v.copy())
             for k in range(-d, d+1, 2):
-                if k == -d:
-                    x = v[k+1]
-                elif k == d:
-                    x = v[k-1] + 1
-                elif v[k-1] < v[k+1]:
-                    x = v[k+1]
+                if d == 0:
+                    x = 0
                 else:
-                    x = v[k-1] + 1
+                    prev_k = self.previous_diagonal(v, k, d, n1, n2)
+
+                    if prev_k is None:
+                        v[k] = -1
+                        continue
+
+                    x = v[prev_k] if prev_k == k + 1 else v[prev_k] + 1
 
                 y = x-k
 
@@ -79,10 +190,11 @@ class Myers:
 
                 v[k] = x
 
-                if x >= n1 and y >= n2:
-                    v_trace.append(v.copy())
+                if x == n1 and y == n2:
                     return v_trace
 
+        return v_trace
+
     def backtrack(self) -> list:
         '''
             backtrack through the edit graph to get a list of patches
@@ -98,29 +210,320 @@ class Myers:
         for d, v in list(enumerate(self.edit_graph_trace))[::-1]:
             k = x - y
 
-            if k == d:
-                prev_pos_k = k - 1
-            elif k == -d:
-                prev_pos_k = k + 1
-            elif v[k-1] < v[k+1]:
-                prev_pos_k = k + 1
+            if d == 0:
+                prev_pos_x, prev_pos_y = 0, 0
             else:
-                prev_pos_k = k - 1
+                prev_pos_k = self.previous_diagonal(v, k, d, n1, n2)
 
-            prev_pos_x = v[prev_pos_k]
-            prev_pos_y = prev_pos_x - prev_pos_k
+                prev_pos_x = v[prev_pos_k]
+                prev_pos_y = prev_pos_x - prev_pos_k
 
             while x > prev_pos_x and y > prev_pos_y:
-                patches.insert(0, ((x-1, y-1),  (x, y)))
+                patches.append(((x-1, y-1),  (x, y)))
                 x, y = x-1, y-1
 
             if d > 0:
-                patches.insert(0, ((prev_pos_x, prev_pos_y), (x, y)))
+                patches.append(((prev_pos_x, prev_pos_y), (x, y)))
 
             x, y = prev_pos_x, prev_pos_y
 
+        # patches are collected end to start
+        patches.reverse()
+
         return patches
 
+    def middle_snake(self, x0 : int, x1 : int, y0 : int, y1 : int) -> tuple:
+        '''
+            runs the forward and the reverse search simultaneously on s1[x0:x1] and s2[y0:y1]
+            till they overlap on some diagonal
+
+            space complexity: O(n1 + n2)
+
+            @returns: (d, x, y, u, v) - length of the shortest edit script and
+                      the middle snake going from (x, y) to (u, v) in absolute coordinates,
+                      None if out of budget
+        '''
+        n1, n2 = x1 - x0, y1 - y0
+        delta = n1 - n2
+        odd = delta % 2 == 1
+
+        max_d = (n1 + n2 + 1) // 2
+
+        # forward and reverse furthest reaching x on each diagonal
+        # reverse search runs on reversed strings, its diagonal c maps to k = delta - c
+        offset = max_d + 1
+        v_f = [-1] * (2 * offset + 1)
+        v_r = [-1] * (2 * offset + 1)
+
+        for d in range(max_d + 1):
+            if self.out_of_budget(2 * d - 1):
+                return None
+
+            for k in range(-d, d + 1, 2):
+                if d == 0:
+                    x = 0
+                else:
+                    prev_k = self.previous_diagonal(v_f, k, d, n1, n2, offset)
+
+                    if prev_k is None:
+                        v_f[offset + k] = -1
+                        continue
+
+                    x = v_f[offset + prev_k] if prev_k == k + 1 else v_f[offset + prev_k] + 1
+
+                y = x - k
+                start_x, start_y = x, y
+
+                while x < n1 and y < n2 and self.s1[x0 + x] == self.s2[y0 + y]:
+                    x, y = x + 1, y + 1
+
+                v_f[offset + k] = x
+
+                c = delta - k
+                if odd and -(d - 1) <= c <= d - 1 and v_r[offset + c] != -1 and x + v_r[offset + c] >= n1:
+                    return 2 * d - 1, x0 + start_x, y0 + start_y, x0 + x, y0 + y
+
+            for c in range(-d, d + 1, 2):
+                if d == 0:
+                    x = 0
+                else:
+                    prev_c = self.previous_diagonal(v_r, c, d, n1, n2, offset)
+
+                    if prev_c is None:
+                        v_r[offset + c] = -1
+                        continue
+
+                    x = v_r[offset + prev_c] if prev_c == c + 1 else v_r[offset + prev_c] + 1
+
+                y = x - c
+                start_x, start_y = x, y
+
+                while x < n1 and y < n2 and self.s1[x1 - x - 1] == self.s2[y1 - y - 1]:
+                    x, y = x + 1, y + 1
+
+                v_r[offset + c] = x
+
+                k = delta - c
+                if not odd and -d <= k <= d and v_f[offset + k] != -1 and x + v_f[offset + k] >= n1:
+                    return 2 * d, x1 - x, y1 - y, x1 - start_x, y1 - start_y
+
+        raise AssertionError('middle snake not found')
+
+    def step(self, v : list, d : int, n1 : int, n2 : int, offset : int, ancestors : list | None = None) -> int | None:
+        '''
+            advances the furthest reaching x of every diagonal from the (d-1)-paths to the d-paths
+            in place, choosing moves like shortest_edit
+
+            @param: offset - index of diagonal 0 in v
+            @param: ancestors - diagonal some earlier level of the path on each diagonal went through,
+                                carried along with the moves
+
+            @returns: the diagonal reaching the end of both texts, None if no d-path does
+        '''
+        s1, s2 = self.s1, self.s2
+
+        for k in range(-d, d + 1, 2):
+            if d == 0:
+                x = 0
+            else:
+                prev_k = self.previous_diagonal(v, k, d, n1, n2, offset)
+
+                if prev_k is None:
+                    v[offset + k] = -1
+                    continue
+
+                x = v[offset + prev_k] if prev_k == k + 1 else v[offset + prev_k] + 1
+                if ancestors is not None:
+                    ancestors[offset + k] = ancestors[offset + prev_k]
+
+            y = x - k
+
+            while x < n1 and y < n2 and s1[x] == s2[y]:
+                x, y = x + 1, y + 1
+
+            v[offset + k] = x
+
+            if x == n1 and y == n2:
+                return k
+
+        return None
+
+    def trace_path(self, v : list, lo : int, hi : int, k_hi : int, offset : int) -> list[tuple[int, int]]:
+        '''
+            path of the shortest edit script between levels lo and hi, found by bisecting the levels
+            the forward search is rerun from level lo and carries the diagonal of every path at the
+            middle level along, so the path of the trace variant is found without its trace
+
+            space complexity: O(D log D)
+
+            @param: v - furthest reaching x of the lo-paths
+            @param: k_hi - diagonal of the path at level hi
+
+            @returns: (diagonal, furthest reaching x) of the path at the levels lo + 1 ... hi
+        '''
+        n1, n2 = len(self.s1), len(self.s2)
+
+        if hi - lo <= TRACE_LEVELS:
+            levels = [v]
+            for d in range(lo + 1, hi + 1):
+                v = v.copy()
+                self.step(v, d, n1, n2, offset)
+                levels.append(v)
+
+            path = []
+            k = k_hi
+            for d in range(hi, lo, -1):
+                path.append((k, levels[d - lo][offset + k]))
+                k = self.previous_diagonal(levels[d - lo - 1], k, d, n1, n2, offset)
+
+            path.reverse()
+            return path
+
+        mid = (lo + hi) // 2
+
+        v_mid = v.copy()
+        for d in range(lo + 1, mid + 1):
+            self.step(v_mid, d, n1, n2, offset)
+
+        ancestors = list(range(-offset, len(v) - offset))
+        v_hi = v_mid.copy()
+        for d in range(mid + 1, hi + 1):
+            self.step(v_hi, d, n1, n2, offset, ancestors)
+
+        k_mid = ancestors[offset + k_hi]
+        del v_hi, ancestors
+
+        return self.trace_path(v, lo, mid, k_mid, offset) + self.trace_path(v_mid, mid, hi, k_hi, offset)
+
+    def linear_edit(self) -> EditScript:
+        '''
+            linear space variant of shortest_edit and backtrack
+            a first forward search finds the edit distance D, trace_path then recovers the path
+
+            @returns: edit script of runs of character level edits
+        '''
+        n1, n2 = len(self.s1), len(self.s2)
+
+        offset = n1 + n2 + 1
+        v = [-1] * (2 * offset + 1)
+
+        for d in range(n1 + n2 + 1):
+            if self.out_of_budget(d):
+                return self.bisect_edit()
+
+            k_end = self.step(v, d, n1, n2, offset)
+            if k_end is not None:
+                break
+
+        # only diagonals -d ... d are used from now on
+        offset = d + 1
+        v = [-1] * (2 * offset + 1)
+        self.step(v, 0, n1, n2, offset)
+
+        edits = EditScript(self.s1, self.s2)
+        edits.append(EQUAL_OP, 0, 0, v[offset])
+
+        prev_k, prev_x = 0, v[offset]
+        for k, x in self.trace_path(v, 0, d, k_end, offset):
+            prev_y = prev_x - prev_k
+
+            if prev_k == k + 1:
+                edits.append(INSERTION_OP, prev_x, prev_y)
+                start_x = prev_x
+            else:
+                edits.append(DELETION_OP, prev_x, prev_y)
+                start_x = prev_x + 1
+
+            edits.append(EQUAL_OP, start_x, start_x - k, x - start_x)
+            prev_k, prev_x = k, x
+
+        return edits
+
+    def bisect_edit(self) -> EditScript:
+        '''
+            divide and conquer on the middle snake, the fallback once the budget is exhausted
+            ranges that can not be searched in budget are split by split_range
+            ranges are processed through an explicit stack so the edits come out in forward order
+
+            @returns: edit script of runs of character level edits
+        '''
+        edits = EditScript(self.s1, self.s2)
+
+        # stack of ranges (x0, x1, y0, y1) still to be solved, a range with x1 == -1
+        # marks a snake from (x0, y0) of length y1 that is already solved
+        stack = [(0, len(self.s1), 0, len(self.s2))]
+
+        while stack:
+            x0, x1, y0, y1 = stack.pop()
+
+            if x1 == -1:
+                edits.append(EQUAL_OP, x0, y0, y1)
+                continue
+
+            # trim common prefix
+            prefix = 0
+            while x0 + prefix < x1 and y0 + prefix < y1 and self.s1[x0 + prefix] == self.s2[y0 + prefix]:
+                prefix += 1
+
+            edits.append(EQUAL_OP, x0, y0, prefix)
+            x0, y0 = x0 + prefix, y0 + prefix
+
+            # trim common suffix, it is emitted once the rest of the range is done
+            suffix = 0
+            while x1 - suffix > x0 and y1 - suffix > y0 and self.s1[x1 - suffix - 1] == self.s2[y1 - suffix - 1]:
+                suffix += 1
+
+            if suffix > 0:
+                stack.append((x1 - suffix, -1, y1 - suffix, suffix))
+                x1, y1 = x1 - suffix, y1 - suffix
+
+            if x0 == x1:
+                edits.append(INSERTION_OP, x0, y0, y1 - y0)
+            elif y0 == y1:
+                edits.append(DELETION_OP, x0, y0, x1 - x0)
+            else:
+                snake = self.middle_snake(x0, x1, y0, y1)
+
+                if snake is None:
+                    self.degraded = True
+                    self.split_range(stack, edits, x0, x1, y0, y1)
+                    continue
+
+                d, x, y, u, v = snake
+
+                if d == 1:
+                    # after the common prefix a single edit is left followed by a snake
+                    if x1 - x0 > y1 - y0:
+                        edits.append(DELETION_OP, x0, y0)
+                        stack.append((x0 + 1, -1, y0, y1 - y0))
+                    else:
+                        edits.append(INSERTION_OP, x0, y0)
+                        stack.append((x0, -1, y0 + 1, x1 - x0))
+                else:
+                    stack.append((u, x1, v, y1))
+                    stack.append((x, -1, y, u - x))
+                    stack.append((x0, x, y0, y))
+
+        return edits
+
+    def split_range(self, stack : list, edits : EditScript, x0 : int, x1 : int, y0 : int, y1 : int) -> None:
+        '''
+            coarse fallback for a range that could not be searched in budget
+            the range is split around a half match if there is one, otherwise it is
+            deleted and inserted wholesale
+        '''
+        match = half_match(self.s1[x0:x1], self.s2[y0:y1])
+
+        if match is None:
+            edits.append(DELETION_OP, x0, y0, x1 - x0)
+            edits.append(INSERTION_OP, x1, y0, y1 - y0)
+            return
+
+        x, y, length = match
+        stack.append((x0 + x + length, x1, y0 + y + length, y1))
+        stack.append((x0 + x, -1, y0 + y, length))
+        stack.append((x0, x0 + x, y0, y0 + y))
+
 
 if __name__ == "__main__":
     text_1 = 'I am the very model of a modern major general.'
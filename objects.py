@@ -0,0 +1,430 @@
+'''
+    implementation of the loose object store
+
+    objects live in .minigit/objects/<first 2 hex chars>/<remaining 38 hex chars>
+    and are stored zlib compressed as b'<type> <size>\0' + payload
+
+    object ids are the SHA-1 of b'<type> <size>\0' + payload like in git, so objects of
+    different types with the same payload (e.g. an empty file and an empty directory)
+    get different ids, FileTreeNode computes the same ids
+
+    files of at least CHUNK_THRESHOLD bytes are stored as chunk blobs and a chunk list
+    object whose id is the blob id of the file, see chunk.py
+
+    loose objects can be moved into packfiles under .minigit/objects/pack, see pack.py
+'''
+
+import hashlib
+import os
+import tempfile
+import zlib
+from typing import BinaryIO, Iterator
+
+from chunk import CHUNK_ENTRY, CHUNK_THRESHOLD, iter_chunks, parse_chunk_list
+from constants import BLOB_TYPE, TREE_TYPE, CHUNKS_TYPE, PACK_DIR
+from pack import Pack, pack_key, write_pack
+
+# size of the chunks files are streamed in
+CHUNK_SIZE = 1 << 16
+# compressed bytes read at once to find the header of a loose object
+HEADER_READ = 64
+
+
+def object_header(obj_type : str, size : int) -> bytes:
+    return f'{obj_type} {size}\0'.encode('ascii')
+
+
+def hash_object(obj_type : str, data : bytes | memoryview) -> str:
+    '''
+        @returns: hex id of an object with the given type and payload
+    '''
+    digest = hashlib.sha1(object_header(obj_type, len(data)))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def hash_stream(f : BinaryIO) -> str:
+    '''
+        @returns: hex id of the blob of an open file, see FileTreeNode
+    '''
+    size = os.fstat(f.fileno()).st_size
+    digest = hashlib.sha1(object_header(BLOB_TYPE, size))
+
+    read = 0
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+
+    while n := f.readinto(buf):
+        read += n
+        digest.update(view[:n])
+
+    if read != size:
+        raise OSError(f'{f.name} changed while being hashed')
+
+    return digest.hexdigest()
+
+
+def hash_chunked(f : BinaryIO) -> str:
+    '''
+        @returns: hex id of the chunk list of an open file, its hash in the tree
+    '''
+    return hash_object(CHUNKS_TYPE, b''.join(
+        CHUNK_ENTRY.pack(bytes.fromhex(hash_object(BLOB_TYPE, chunk)), len(chunk)) for chunk in iter_chunks(f)
+    ))
+
+
+def parse_tree(data : bytes) -> list[tuple[str, str, str]]:
+    '''
+        @param: data - serialized tree, see FileTreeNode.serialize
+
+        @returns: list of (object type, name, hex digest) in tree order
+    '''
+    entries = []
+    pos = 0
+
+    while pos < len(data):
+        space = data.index(b' ', pos)
+        nul = data.index(b'\0', space)
+
+        obj_type = data[pos:space].decode('ascii')
+        name = data[space + 1:nul].decode('utf-8', 'surrogateescape')
+        digest = data[nul + 1:nul + 21].hex()
+
+        entries.append((obj_type, name, digest))
+        pos = nul + 21
+
+    return entries
+
+
+class ObjectStore:
+    '''
+        content addressed store of zlib compressed objects
+    '''
+    def __init__(self, objects_dir : str) -> None:
+        '''
+            @param: objects_dir - root of the store (usually .minigit/objects)
+        '''
+        self.objects_dir = objects_dir
+        self.pack_dir = os.path.join(objects_dir, PACK_DIR)
+
+        # loaded lazily on the first lookup that misses the loose objects
+        self.packs = None
+
+    def __getstate__(self) -> dict:
+        '''
+            open packs hold memory maps, which cannot be pickled, a copy sent to
+            another process (e.g. a worker of the parallel file tree) reopens them lazily
+        '''
+        state = self.__dict__.copy()
+        state['packs'] = None
+        return state
+
+    def load_packs(self) -> list[Pack]:
+        '''
+            open every pack that has an index
+        '''
+        if self.packs is None:
+            self.packs = []
+            if os.path.isdir(self.pack_dir):
+                for name in sorted(os.listdir(self.pack_dir)):
+                    path = os.path.join(self.pack_dir, name)
+                    if name.endswith('.pack') and os.path.exists(path[:-len('.pack')] + '.idx'):
+                        self.packs.append(Pack(path))
+
+        return self.packs
+
+    def close(self) -> None:
+        '''
+            unmap all open packs
+        '''
+        for pack in self.packs or []:
+            pack.close()
+        self.packs = None
+
+    def object_path(self, sha : str) -> str:
+        '''
+            @returns: location of the object with the given hex digest
+        '''
+        return os.path.join(self.objects_dir, sha[:2], sha[2:])
+
+    def contains(self, sha : str) -> bool:
+        if os.path.exists(self.object_path(sha)):
+            return True
+
+        return any(pack.contains(sha) for pack in self.load_packs())
+
+    def publish(self, tmp_path : str, sha : str) -> None:
+        '''
+            atomically move a fully written temporary object into place
+            if the object already exists the temporary file is dropped
+        '''
+        path = self.object_path(sha)
+
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def write_file(self, path : str) -> str:
+        '''
+            store the file as a blob object
+            the file is hashed and compressed in a single streaming read
+
+            @param: path - path of the file
+
+            @returns: hex digest of the blob, of the chunk list for large files
+        '''
+        if os.path.getsize(path) >= CHUNK_THRESHOLD:
+            return self.write_chunked(path)
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        compressor = zlib.compressobj()
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, prefix='tmp_obj_')
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                size = os.fstat(src.fileno()).st_size
+                header = object_header(BLOB_TYPE, size)
+                digest = hashlib.sha1(header)
+                dst.write(compressor.compress(header))
+
+                read = 0
+                buf = bytearray(CHUNK_SIZE)
+                view = memoryview(buf)
+
+                while True:
+                    n = src.readinto(buf)
+                    if not n:
+                        break
+                    read += n
+                    digest.update(view[:n])
+                    dst.write(compressor.compress(view[:n]))
+
+                if read != size:
+                    raise OSError(f'{path} changed while being stored')
+
+                dst.write(compressor.flush())
+
+            sha = digest.hexdigest()
+            self.publish(tmp_path, sha)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return sha
+
+    def write_chunked(self, path : str) -> str:
+        '''
+            store the file as content defined chunks and their chunk list
+            chunks already in the store (e.g. from an earlier version of the file) are not rewritten
+
+            @param: path - path of the file
+
+            @returns: hex digest of the chunk list
+        '''
+        entries = []
+
+        with open(path, 'rb') as src:
+            size = os.fstat(src.fileno()).st_size
+            read = 0
+
+            for chunk in iter_chunks(src):
+                chunk_sha = self.write(BLOB_TYPE, chunk)
+                entries.append(CHUNK_ENTRY.pack(bytes.fromhex(chunk_sha), len(chunk)))
+                read += len(chunk)
+
+        if read != size:
+            raise OSError(f'{path} changed while being stored')
+
+        return self.write(CHUNKS_TYPE, b''.join(entries))
+
+    def write(self, obj_type : str, data : bytes, sha : str | None = None) -> str:
+        '''
+            store an in memory object
+
+            @param: obj_type - BLOB_TYPE / TREE_TYPE / CHUNKS_TYPE
+            @param: data - object payload
+            @param: sha - known id of the object, existing objects are not rewritten
+
+            @returns: hex digest of the object
+        '''
+        if sha is None:
+            sha = hash_object(obj_type, data)
+
+        if self.contains(sha):
+            return sha
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, prefix='tmp_obj_')
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                dst.write(zlib.compress(object_header(obj_type, len(data)) + data))
+            self.publish(tmp_path, sha)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return sha
+
+    def read(self, sha : str) -> tuple[str, bytes]:
+        '''
+            @returns: (object type, payload) of the object
+        '''
+        try:
+            with open(self.object_path(sha), 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            for pack in self.load_packs():
+                if pack.contains(sha):
+                    return pack.read(sha)
+            raise KeyError(sha)
+
+        nul = raw.index(b'\0')
+        obj_type, size = raw[:nul].decode('ascii').split(' ')
+        data = raw[nul + 1:]
+
+        assert len(data) == int(size)
+
+        return obj_type, data
+
+    def iter_blob(self, sha : str) -> Iterator[bytes]:
+        '''
+            contents of a file, chunk by chunk for chunked files
+
+            @param: sha - blob id from a tree, the id of a blob or of a chunk list
+
+            @yields: consecutive parts of the file contents
+        '''
+        obj_type, data = self.read(sha)
+
+        if obj_type == BLOB_TYPE:
+            yield data
+            return
+
+        assert obj_type == CHUNKS_TYPE
+
+        for chunk_sha, size in parse_chunk_list(data):
+            obj_type, chunk = self.read(chunk_sha)
+            assert obj_type == BLOB_TYPE and len(chunk) == size
+            yield chunk
+
+    def read_blob(self, sha : str) -> bytes:
+        '''
+            @returns: contents of the file, chunked files are reassembled
+        '''
+        return b''.join(self.iter_blob(sha))
+
+    def read_tree(self, sha : str) -> list[tuple[str, str, str]]:
+        '''
+            @returns: entries of the stored tree, see parse_tree
+        '''
+        obj_type, data = self.read(sha)
+        assert obj_type == TREE_TYPE
+
+        return parse_tree(data)
+
+    def write_tree(self, root) -> str:
+        '''
+            store every tree object of a file tree, blobs are expected to be stored already
+
+            a tree that is already stored implies its whole subtree is stored, so it is skipped
+
+            @param: root - FileTreeNode of a directory
+
+            @returns: hex digest of the root tree
+        '''
+        stack = [(root, False)]
+
+        while stack:
+            node, children_done = stack.pop()
+
+            if node.is_blob or self.contains(node.content_hash):
+                continue
+
+            if children_done:
+                self.write(TREE_TYPE, node.serialize(), node.content_hash)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+
+        return root.content_hash
+
+    def loose_objects(self) -> list[str]:
+        '''
+            @returns: hex digests of all loose objects
+        '''
+        shas = []
+        if not os.path.isdir(self.objects_dir):
+            return shas
+
+        for fanout in os.listdir(self.objects_dir):
+            if len(fanout) != 2:
+                continue
+            for name in os.listdir(os.path.join(self.objects_dir, fanout)):
+                if not name.startswith('tmp_'):
+                    shas.append(fanout + name)
+
+        return shas
+
+    def loose_header(self, sha : str) -> tuple[str, int]:
+        '''
+            @returns: (object type, payload size) of a loose object, only its start is decompressed
+        '''
+        decompressor = zlib.decompressobj()
+        raw = b''
+
+        with open(self.object_path(sha), 'rb') as f:
+            while (nul := raw.find(b'\0')) == -1:
+                data = f.read(HEADER_READ)
+                if not data:
+                    raise ValueError(f'object {sha} has no header')
+                raw += decompressor.decompress(data)
+
+        obj_type, size = raw[:nul].decode('ascii').split(' ')
+        return obj_type, int(size)
+
+    def repack(self) -> str | None:
+        '''
+            move all loose objects into a new pack
+            names found in the stored trees are used as hints to find delta bases
+
+            the objects are ordered from their headers and the trees, and then read one by one
+            while the pack is written, so memory does not grow with the size of the store
+
+            @returns: path of the new pack, None if there was nothing to pack
+        '''
+        shas = self.loose_objects()
+        if not shas:
+            return None
+
+        headers = {sha: self.loose_header(sha) for sha in shas}
+
+        names = {}
+        for sha, (obj_type, _) in headers.items():
+            if obj_type == TREE_TYPE:
+                for _, name, child_sha in self.read_tree(sha):
+                    names.setdefault(child_sha, name)
+
+        order = sorted(shas, key=lambda sha: pack_key(headers[sha][0], names.get(sha, ''), headers[sha][1]))
+
+        pack_path = write_pack(self.pack_dir, (
+            (sha, *self.read(sha), names.get(sha, '')) for sha in order
+        ))
+
+        self.close()
+
+        for sha in shas:
+            path = self.object_path(sha)
+            os.remove(path)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+        return pack_path
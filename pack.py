@@ -0,0 +1,302 @@
+'''
+    implementation of packfiles
+
+    a pack bundles many objects into a single file next to a sorted index
+        pack-<id>.pack - header, then per object an entry header and its zlib compressed payload
+                         similar objects are stored as copy / insert deltas against an earlier entry
+        pack-<id>.idx  - header, 256 entry fan-out table, sorted raw SHA-1s, pack offsets
+
+    both files are memory-mapped, lookups binary search the index
+'''
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+from typing import BinaryIO, Iterable
+
+from constants import BLOB_TYPE, TREE_TYPE, CHUNKS_TYPE
+from delta import block_index, block_hits, create_delta, apply_delta
+
+PACK_SIGNATURE = b'MGPK'
+IDX_SIGNATURE = b'MGPI'
+PACK_VERSION = 1
+
+# signature, version, number of objects
+PACK_HEADER = struct.Struct('>4sII')
+IDX_HEADER = struct.Struct('>4sII')
+
+# type code, size of the payload, size of the compressed payload
+PACK_ENTRY = struct.Struct('>BQQ')
+# offset of the base entry, follows the entry header of delta entries
+PACK_BASE = struct.Struct('>Q')
+
+FANOUT = struct.Struct('>256I')
+OFFSET = struct.Struct('>Q')
+
+TYPE_CODES = {BLOB_TYPE: 1, TREE_TYPE: 2, CHUNKS_TYPE: 4}
+CODE_TYPES = {code: obj_type for obj_type, code in TYPE_CODES.items()}
+DELTA_CODE = 3
+
+# number of preceding objects tried as delta base
+DELTA_WINDOW = 10
+# longest chain of deltas to resolve when reading an object
+MAX_DELTA_DEPTH = 10
+# objects smaller than this are never deltified
+MIN_DELTA_SIZE = 64
+
+# bytes of resolved objects kept per pack
+CACHE_SIZE = 16 << 20
+
+
+def pack_key(obj_type : str, name : str, size : int) -> tuple:
+    '''
+        @returns: sort key of an object in a pack, by type, name hint and decreasing size
+                  so similar objects end up close to each other
+    '''
+    return obj_type, name, -size
+
+
+def write_pack(pack_dir : str, objects : Iterable[tuple[str, str, bytes, str]]) -> str:
+    '''
+        write a pack file and its index
+
+        objects are written as they come, each one is deltified against the best of the
+        DELTA_WINDOW objects preceding it if that saves at least half of its size, only
+        that window is held in memory
+
+        @param: pack_dir - directory the pack is written to
+        @param: objects - (hex digest, object type, payload, name hint) in pack_key order,
+                          repeated objects are written once
+
+        @returns: path of the pack file
+    '''
+    os.makedirs(pack_dir, exist_ok=True)
+
+    fd, tmp_pack = tempfile.mkstemp(dir=pack_dir, prefix='tmp_pack_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            offsets = write_entries(f, objects)
+    except BaseException:
+        os.remove(tmp_pack)
+        raise
+
+    shas = sorted(offsets)
+    pack_id = hashlib.sha1(''.join(shas).encode('ascii')).hexdigest()
+    pack_path = os.path.join(pack_dir, f'pack-{pack_id}.pack')
+    idx_path = os.path.join(pack_dir, f'pack-{pack_id}.idx')
+
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[int(sha[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    idx_parts = [IDX_HEADER.pack(IDX_SIGNATURE, PACK_VERSION, len(shas)), FANOUT.pack(*fanout)]
+    idx_parts.extend(bytes.fromhex(sha) for sha in shas)
+    idx_parts.extend(OFFSET.pack(offsets[sha]) for sha in shas)
+
+    # the index is published last, a pack without index is never read
+    os.replace(tmp_pack, pack_path)
+    with open(idx_path + '.tmp', 'wb') as f:
+        f.write(b''.join(idx_parts))
+    os.replace(idx_path + '.tmp', idx_path)
+
+    return pack_path
+
+
+def write_entries(f : BinaryIO, objects : Iterable[tuple[str, str, bytes, str]]) -> dict[str, int]:
+    '''
+        write the header and the entries of a pack, the header is completed at the end
+
+        @returns: hex digest -> offset of the entry
+    '''
+    f.write(PACK_HEADER.pack(PACK_SIGNATURE, PACK_VERSION, 0))
+    pos = PACK_HEADER.size
+
+    offsets = {}
+
+    # (object type, payload, block index, offset, delta depth) of the preceding objects
+    window = []
+
+    for sha, obj_type, data, _ in objects:
+        if sha in offsets:
+            continue
+
+        best = None
+
+        # a base less than half the size can not save half of it
+        bases = [] if len(data) < MIN_DELTA_SIZE else [
+            base for base in window
+            if base[0] == obj_type and base[4] < MAX_DELTA_DEPTH and len(base[1]) >= len(data) // 2
+        ]
+
+        if bases:
+            # the target is looked up once for all the bases
+            hits = block_hits(data, set().union(*(base[2] for base in bases)))
+
+            for _, base_data, index, base_offset, depth in bases:
+                # only a delta smaller than half the object and than the best one so far is of use
+                max_size = (len(data) // 2 if best is None else len(best[0])) - 1
+                delta = create_delta(base_data, data, max_size=max_size, index=index, hits=hits)
+                if delta is not None:
+                    best = (delta, base_offset, depth + 1)
+
+        if best is None:
+            payload = zlib.compress(data)
+            f.write(PACK_ENTRY.pack(TYPE_CODES[obj_type], len(data), len(payload)))
+            depth = 0
+            entry_size = PACK_ENTRY.size
+        else:
+            delta, base_offset, depth = best
+            payload = zlib.compress(delta)
+            f.write(PACK_ENTRY.pack(DELTA_CODE, len(delta), len(payload)))
+            f.write(PACK_BASE.pack(base_offset))
+            entry_size = PACK_ENTRY.size + PACK_BASE.size
+
+        f.write(payload)
+        offsets[sha] = pos
+        pos += entry_size + len(payload)
+
+        window.append((obj_type, data, block_index(data), offsets[sha], depth))
+        if len(window) > DELTA_WINDOW:
+            window.pop(0)
+
+    f.seek(0)
+    f.write(PACK_HEADER.pack(PACK_SIGNATURE, PACK_VERSION, len(offsets)))
+
+    return offsets
+
+
+class Pack:
+    '''
+        read access to a pack file through its memory-mapped index
+    '''
+    def __init__(self, pack_path : str) -> None:
+        '''
+            @param: pack_path - path of the .pack file, the .idx file is expected next to it
+        '''
+        self.pack_path = pack_path
+        self.idx_path = pack_path[:-len('.pack')] + '.idx'
+
+        with open(self.pack_path, 'rb') as f:
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.idx_path, 'rb') as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.view = memoryview(self.pack)
+
+        signature, version, _ = PACK_HEADER.unpack_from(self.pack, 0)
+        assert signature == PACK_SIGNATURE and version == PACK_VERSION
+
+        signature, version, self.count = IDX_HEADER.unpack_from(self.idx, 0)
+        assert signature == IDX_SIGNATURE and version == PACK_VERSION
+
+        self.fanout = FANOUT.unpack_from(self.idx, IDX_HEADER.size)
+        self.sha_start = IDX_HEADER.size + FANOUT.size
+        self.offset_start = self.sha_start + 20 * self.count
+
+        # offset -> (object type, payload) of recently resolved objects
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+
+    def lookup(self, sha : str) -> int | None:
+        '''
+            binary search the index
+
+            @returns: offset of the object in the pack, None if it is not in the pack
+        '''
+        key = bytes.fromhex(sha)
+
+        lo = self.fanout[key[0] - 1] if key[0] else 0
+        hi = self.fanout[key[0]]
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self.sha_start + 20 * mid
+            mid_key = self.idx[pos:pos + 20]
+
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return OFFSET.unpack_from(self.idx, self.offset_start + 8 * mid)[0]
+
+        return None
+
+    def contains(self, sha : str) -> bool:
+        return self.lookup(sha) is not None
+
+    def shas(self) -> list[str]:
+        '''
+            @returns: hex digests of all objects in the pack, sorted
+        '''
+        return [self.idx[pos:pos + 20].hex() for pos in range(self.sha_start, self.offset_start, 20)]
+
+    def remember(self, offset : int, obj : tuple[str, bytes]) -> None:
+        '''
+            add a resolved object to the bounded cache, evicting the least recently used ones
+        '''
+        if len(obj[1]) > CACHE_SIZE or offset in self.cache:
+            return
+
+        self.cache[offset] = obj
+        self.cache_bytes += len(obj[1])
+
+        while self.cache_bytes > CACHE_SIZE:
+            _, (_, data) = self.cache.popitem(last=False)
+            self.cache_bytes -= len(data)
+
+    def read_at(self, offset : int) -> tuple[str, bytes]:
+        '''
+            decompress the entry at offset and resolve its delta chain
+
+            @returns: (object type, payload)
+        '''
+        # (offset, payload start, compressed size) of the delta entries down to the base
+        chain = []
+
+        while True:
+            obj = self.cache.get(offset)
+            if obj is not None:
+                self.cache.move_to_end(offset)
+                break
+
+            code, _, compressed_size = PACK_ENTRY.unpack_from(self.pack, offset)
+            start = offset + PACK_ENTRY.size
+
+            if code == DELTA_CODE:
+                base_offset, = PACK_BASE.unpack_from(self.pack, start)
+                start += PACK_BASE.size
+                chain.append((offset, start, compressed_size))
+                offset = base_offset
+            else:
+                obj = (CODE_TYPES[code], zlib.decompress(self.view[start:start + compressed_size]))
+                self.remember(offset, obj)
+                break
+
+        obj_type, data = obj
+        for offset, start, compressed_size in reversed(chain):
+            data = apply_delta(data, zlib.decompress(self.view[start:start + compressed_size]))
+            self.remember(offset, (obj_type, data))
+
+        return obj_type, data
+
+    def read(self, sha : str) -> tuple[str, bytes]:
+        '''
+            @returns: (object type, payload) of the object
+        '''
+        offset = self.lookup(sha)
+        if offset is None:
+            raise KeyError(sha)
+
+        return self.read_at(offset)
+
+    def close(self) -> None:
+        self.view.release()
+        self.pack.close()
+        self.idx.close()
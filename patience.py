@@ -0,0 +1,142 @@
+'''
+    patience / histogram line diff
+
+    lines occurring exactly once in both ranges are matched first (patience diff)
+    and the ranges between them are diffed recursively, a range without such lines
+    is split on the longest matching block around its least frequent line (histogram diff)
+    small leftover ranges and ranges made only of very frequent lines are handed to the
+    Hirschberg LCS
+
+    runs in near linear time on similar files and aligns on distinctive lines
+    instead of on repeated ones like '}' or blank lines
+'''
+
+from lcs import LCS
+from utils import unique_anchors
+
+# ranges with at most this many DP cells are solved by the LCS
+LCS_CELLS = 1 << 12
+# lines occurring more often than this are never used to split a range
+MAX_OCCURRENCES = 64
+
+
+class Patience(LCS):
+    '''
+        line level diff anchored on low occurrence lines, see LCS for the interface
+    '''
+    algorithm = 'patience'
+
+    def compute_lcs(self, x0: int, x1: int, y0: int, y1: int, depth: int = 0) -> list[tuple]:
+        '''
+            matches of a[x0:x1] and b[y0:y1], ranges are processed through an explicit stack
+            so the matches come out in order
+
+            @param: depth - recursion depth of the call, passed on to the LCS
+
+            @returns: list of matches as tuples
+        '''
+        a, b = self.a, self.b
+        matches = []
+
+        # stack of ranges (x0, x1, y0, y1), a range with x1 == -1 marks the match (x0, y0)
+        stack = [(x0, x1, y0, y1)]
+
+        while stack:
+            x0, x1, y0, y1 = stack.pop()
+
+            if x1 == -1:
+                matches.append((x0, y0))
+                continue
+
+            if (x1 - x0) * (y1 - y0) <= LCS_CELLS:
+                matches.extend(super().compute_lcs(x0, x1, y0, y1, depth))
+                continue
+
+            while x0 < x1 and y0 < y1 and a[x0] == b[y0]:
+                matches.append((x0, y0))
+                x0, y0 = x0 + 1, y0 + 1
+
+            while x0 < x1 and y0 < y1 and a[x1 - 1] == b[y1 - 1]:
+                x1, y1 = x1 - 1, y1 - 1
+                stack.append((x1, -1, y1, -1))
+
+            if x0 == x1 or y0 == y1:
+                continue
+
+            anchors = unique_anchors(a[x0:x1], b[y0:y1])
+
+            if anchors:
+                blocks = [(x0 + i, y0 + j, 1) for i, j in anchors]
+            else:
+                block = self.histogram_block(x0, x1, y0, y1)
+                if block is None:
+                    # only very frequent lines (e.g. '}' or blank lines) are left to align
+                    matches.extend(super().compute_lcs(x0, x1, y0, y1, depth))
+                    continue
+                blocks = [block]
+
+            # ranges between the blocks, pushed in reverse so they come out in order
+            end_x, end_y = x1, y1
+            for i, j, length in reversed(blocks):
+                stack.append((i + length, end_x, j + length, end_y))
+                for k in range(length - 1, -1, -1):
+                    stack.append((i + k, -1, j + k, -1))
+                end_x, end_y = i, j
+            stack.append((x0, end_x, y0, end_y))
+
+        return matches
+
+    def histogram_block(self, x0: int, x1: int, y0: int, y1: int) -> tuple | None:
+        '''
+            finds the matching block around the line of a[x0:x1] with the fewest occurrences,
+            longer blocks win among lines occurring equally often
+
+            @returns: (start in a, start in b, length) or None if no line of a[x0:x1]
+                      occurring at most MAX_OCCURRENCES times is in b[y0:y1]
+        '''
+        a, b = self.a, self.b
+
+        positions = {}
+        for i in range(x0, x1):
+            positions.setdefault(a[i], []).append(i)
+
+        # (occurrences, length, start in a, start in b)
+        best = None
+
+        j = y0
+        while j < y1:
+            occurrences = positions.get(b[j])
+            if occurrences is None or len(occurrences) > MAX_OCCURRENCES or \
+                    (best is not None and len(occurrences) > best[0]):
+                j += 1
+                continue
+
+            next_j = j + 1
+            for i in occurrences:
+                si, sj = i, j
+                while si > x0 and sj > y0 and a[si - 1] == b[sj - 1]:
+                    si, sj = si - 1, sj - 1
+
+                ei, ej = i + 1, j + 1
+                while ei < x1 and ej < y1 and a[ei] == b[ej]:
+                    ei, ej = ei + 1, ej + 1
+
+                if best is None or len(occurrences) < best[0] or ei - si > best[1]:
+                    best = (len(occurrences), ei - si, si, sj)
+
+                # the rest of the block would find the same match
+                next_j = max(next_j, ej)
+
+            j = next_j
+
+        if best is None:
+            return None
+
+        return best[2], best[3], best[1]
+
+
+if __name__ == '__main__':
+    text_1 = open("./test/file_1.txt").read()
+    text_2 = open("./test/file_2.txt").read()
+
+    print(Patience(text_1, text_2).to_diff())
@@ -0,0 +1,166 @@
+'''
+    rsync style delta of binary files
+
+    the base is cut into fixed blocks, each indexed by a weak rolling checksum and a
+    strong hash, the checksum is rolled over the target one byte at a time and a block
+    is copied when both hashes match, so the delta is found in linear time whatever
+    the content, unlike the text engines which only handle str
+
+    inputs are bytes or memoryviews (e.g. of memory-mapped files) and are only read
+    through views, the delta uses the copy / insert encoding of delta.py and is applied
+    with delta.apply_delta
+'''
+
+import hashlib
+import math
+import mmap
+from itertools import accumulate
+
+from delta import DELTA_HEADER, COPY_OP, COPY_CODE, encode_insert
+from stream import map_file
+
+MIN_BLOCK = 1 << 9
+MAX_BLOCK = 1 << 16
+
+# the two halves of the weak checksum are kept modulo CHECKSUM_MOD
+CHECKSUM_MOD = 1 << 16
+CHECKSUM_MASK = CHECKSUM_MOD - 1
+
+
+def block_size_for(length : int) -> int:
+    '''
+        @returns: block size of roughly sqrt(length) like rsync, within [MIN_BLOCK, MAX_BLOCK]
+    '''
+    return min(MAX_BLOCK, max(MIN_BLOCK, math.isqrt(length)))
+
+
+def weak_checksum(block : bytes | memoryview) -> tuple[int, int]:
+    '''
+        @returns: (a, b) halves of the rolling checksum of the block
+            a - sum of the bytes
+            b - sum of the bytes weighted by their distance to the end of the block
+    '''
+    return sum(block) & CHECKSUM_MASK, sum(accumulate(block)) & CHECKSUM_MASK
+
+
+def strong_hash(block : bytes | memoryview) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def signature(base : bytes | memoryview, block_size : int) -> dict[int, list[tuple[bytes, int]]]:
+    '''
+        index of the full blocks of the base, a trailing partial block is not indexed
+
+        @returns: weak checksum -> list of (strong hash, offset) of the blocks having it
+    '''
+    base = memoryview(base)
+    index = {}
+
+    for offset in range(0, len(base) - block_size + 1, block_size):
+        block = base[offset:offset + block_size]
+        a, b = weak_checksum(block)
+        index.setdefault(a | b << 16, []).append((strong_hash(block), offset))
+
+    return index
+
+
+def rsync_delta(base : bytes | memoryview, target : bytes | memoryview, block_size : int | None = None) -> bytes:
+    '''
+        copy / insert delta of target against base
+
+        a matched block is extended forwards as long as the following blocks match
+        and consecutive copies are merged, after a match the checksum is recomputed
+        at the new position instead of being rolled over the copied bytes
+
+        @param: block_size - size of the base blocks, chosen from the size of the base by default
+
+        @returns: encoded delta, see delta.py
+    '''
+    base, target = memoryview(base), memoryview(target)
+    n_base, n_target = len(base), len(target)
+
+    if block_size is None:
+        block_size = block_size_for(n_base)
+
+    parts = [DELTA_HEADER.pack(n_base, n_target)]
+    index = signature(base, block_size)
+
+    # pending copy (base offset, length) and start of the pending insertion
+    copy_offset, copy_length = 0, 0
+    insert_start = 0
+
+    def flush_copy() -> None:
+        if copy_length:
+            parts.append(COPY_OP.pack(COPY_CODE, copy_offset, copy_length))
+
+    pos = 0
+    rolling = False
+    a = b = 0
+
+    while index and pos + block_size <= n_target:
+        if not rolling:
+            a, b = weak_checksum(target[pos:pos + block_size])
+            rolling = True
+
+        offset = None
+        candidates = index.get(a | b << 16)
+
+        if candidates is not None:
+            strong = strong_hash(target[pos:pos + block_size])
+            for candidate_strong, candidate_offset in candidates:
+                if candidate_strong == strong:
+                    offset = candidate_offset
+                    break
+
+        if offset is None:
+            if pos + block_size == n_target:
+                break
+
+            # roll the window one byte forward
+            out_byte, in_byte = target[pos], target[pos + block_size]
+            a = (a - out_byte + in_byte) & CHECKSUM_MASK
+            b = (b - block_size * out_byte + a) & CHECKSUM_MASK
+            pos += 1
+            continue
+
+        # extend the match forwards, block by block and then over the common tail
+        length = block_size
+        while pos + length + block_size <= n_target and offset + length + block_size <= n_base and \
+                target[pos + length:pos + length + block_size] == base[offset + length:offset + length + block_size]:
+            length += block_size
+        # the partial last block of the base is not indexed, it is matched byte by byte
+        if offset + length + block_size > n_base:
+            limit = min(n_base - offset, n_target - pos)
+            while length < limit and target[pos + length] == base[offset + length]:
+                length += 1
+
+        if insert_start == pos and copy_length and copy_offset + copy_length == offset:
+            copy_length += length
+        else:
+            flush_copy()
+            encode_insert(parts, target[insert_start:pos])
+            copy_offset, copy_length = offset, length
+
+        pos = insert_start = pos + length
+        rolling = False
+
+    flush_copy()
+    encode_insert(parts, target[insert_start:])
+
+    return b''.join(parts)
+
+
+def rsync_delta_files(base_path : str, target_path : str, block_size : int | None = None) -> bytes:
+    '''
+        delta between two files, both are memory-mapped and never read into memory as a whole
+
+        @returns: encoded delta, see delta.py
+    '''
+    base, target = map_file(base_path), map_file(target_path)
+
+    try:
+        return rsync_delta(base, target, block_size)
+    finally:
+        for data in (base, target):
+            if isinstance(data, mmap.mmap):
+                data.close()
@@ -0,0 +1,277 @@
+'''
+    flat columnar snapshot of a file tree
+
+    the nodes are stored in breadth first order, so the children of a node are contiguous
+    and the parent column is sorted, every column is a packed array
+
+        header       - magic, version, number of nodes, size of the string table
+        parents      - int32 index of the parent of every node, -1 for the root
+        name offsets - uint32 start of the name of every node in the string table, plus the end
+        modes        - uint32 stat mode of every node
+        digests      - raw 20 byte SHA-1 of every node
+        names        - string table of the utf-8 names, the root is named by its full path
+
+    the file is memory-mapped and the columns are used in place, so loading costs nothing
+    whatever the size of the tree, children are found by bisecting the parent column and
+    names are only decoded on lookup
+
+    trees do not record executable bits yet, modes only tell directories from regular files
+'''
+
+import mmap
+import os
+import stat
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+
+from constants import BLOB_TYPE, TREE_TYPE
+from filetree import FileTreeNode
+
+SNAPSHOT_FILE = 'snapshot'
+
+SNAPSHOT_SIGNATURE = b'MGSN'
+SNAPSHOT_VERSION = 1
+
+# signature, version, number of nodes, size of the string table
+SNAPSHOT_HEADER = struct.Struct('<4sIQQ')
+DIGEST_SIZE = 20
+
+DIR_MODE = stat.S_IFDIR | 0o755
+FILE_MODE = stat.S_IFREG | 0o644
+
+
+def little_endian(column : array) -> bytes:
+    '''
+        @returns: the column as little-endian bytes
+    '''
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+
+    return column.tobytes()
+
+
+def write_snapshot(root : FileTreeNode, path : str) -> None:
+    '''
+        write the snapshot of a hashed file tree, the file is replaced atomically
+
+        @param: root - root node, a FileTreeNode or the root of another snapshot
+    '''
+    parents = array('i')
+    offsets = array('I')
+    modes = array('I')
+    digests = []
+    names = []
+    size = 0
+
+    queue = [(root, -1)]
+    for i, (node, parent) in enumerate(queue):
+        name = (node.path if parent == -1 else os.path.basename(node.path)).encode('utf-8', 'surrogateescape')
+
+        parents.append(parent)
+        offsets.append(size)
+        modes.append(FILE_MODE if node.is_blob else DIR_MODE)
+        digests.append(bytes.fromhex(node.calculate_hash()))
+        names.append(name)
+        size += len(name)
+
+        queue.extend((child, i) for child in node.children)
+
+    offsets.append(size)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='tmp_snapshot_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_SIGNATURE, SNAPSHOT_VERSION, len(parents), size))
+            for column in (parents, offsets, modes):
+                f.write(little_endian(column))
+            f.write(b''.join(digests))
+            f.write(b''.join(names))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class Snapshot:
+    '''
+        memory-mapped snapshot, see write_snapshot
+    '''
+    def __init__(self, path : str) -> None:
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, count, names_size = SNAPSHOT_HEADER.unpack_from(self.mm, 0)
+        if signature != SNAPSHOT_SIGNATURE or version != SNAPSHOT_VERSION:
+            self.mm.close()
+            raise ValueError(f'{path} is not a tree snapshot')
+
+        self.count = count
+        self.view = memoryview(self.mm)
+
+        pos = SNAPSHOT_HEADER.size
+        self.parents, pos = self.column('i', pos, count)
+        self.offsets, pos = self.column('I', pos, count + 1)
+        self.modes, pos = self.column('I', pos, count)
+        self.digests = self.view[pos:pos + count * DIGEST_SIZE]
+        pos += count * DIGEST_SIZE
+        self.names = self.view[pos:pos + names_size]
+
+        if pos + names_size != len(self.mm):
+            self.close()
+            raise ValueError(f'{path} is truncated')
+
+    def column(self, typecode : str, pos : int, length : int) -> tuple[memoryview | array, int]:
+        '''
+            @returns: (column of length items at pos, position after the column)
+                      the column is a view of the map unless the host is big-endian
+        '''
+        end = pos + length * 4
+        if sys.byteorder == 'little':
+            return self.view[pos:end].cast(typecode), end
+
+        column = array(typecode, self.view[pos:end])
+        column.byteswap()
+        return column, end
+
+    def close(self) -> None:
+        for column in (self.parents, self.offsets, self.modes, self.digests, self.names, self.view):
+            if isinstance(column, memoryview):
+                column.release()
+        self.mm.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def name(self, i : int) -> str:
+        return str(self.names[self.offsets[i]:self.offsets[i + 1]], 'utf-8', 'surrogateescape')
+
+    def path(self, i : int) -> str:
+        parts = []
+        while i > 0:
+            parts.append(self.name(i))
+            i = self.parents[i]
+        parts.append(self.name(0))
+
+        return os.path.join(*reversed(parts))
+
+    def digest(self, i : int) -> str:
+        return self.digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE].hex()
+
+    def is_blob(self, i : int) -> bool:
+        return not stat.S_ISDIR(self.modes[i])
+
+    def children(self, i : int) -> range:
+        '''
+            @returns: indices of the children of node i, in tree order
+        '''
+        lo = bisect_left(self.parents, i, i + 1)
+        return range(lo, bisect_right(self.parents, i, lo))
+
+    def child(self, i : int, name : str) -> int | None:
+        '''
+            @returns: index of the child of node i with the given name
+        '''
+        children = self.children(i)
+        j = bisect_left(children, name, key=self.name)
+
+        if j < len(children) and self.name(children[j]) == name:
+            return children[j]
+        return None
+
+    @property
+    def root(self) -> "SnapshotNode":
+        return SnapshotNode(self, 0)
+
+    def to_tree(self) -> FileTreeNode:
+        '''
+            @returns: the snapshot as an in memory tree of FileTreeNode, e.g. to apply changes to it
+        '''
+        nodes = [None] * self.count
+
+        # children come after their parents
+        for i in range(self.count - 1, -1, -1):
+            children = [nodes[j] for j in self.children(i)]
+            nodes[i] = FileTreeNode(children, self.path(i), self.is_blob(i), self.digest(i))
+            for j in self.children(i):
+                nodes[j] = None
+
+        return nodes[0]
+
+
+class SnapshotNode(FileTreeNode):
+    '''
+        read-only FileTreeNode interface to a node of a snapshot, nodes are made on access
+    '''
+    def __init__(self, snapshot : Snapshot, index : int) -> None:
+        self.snapshot = snapshot
+        self.index = index
+
+    @property
+    def path(self) -> str:
+        return self.snapshot.path(self.index)
+
+    @property
+    def is_blob(self) -> bool:
+        return self.snapshot.is_blob(self.index)
+
+    @property
+    def content_hash(self) -> str:
+        return self.snapshot.digest(self.index)
+
+    @property
+    def parent(self) -> "SnapshotNode | None":
+        parent = self.snapshot.parents[self.index]
+        return None if parent == -1 else SnapshotNode(self.snapshot, parent)
+
+    @property
+    def children(self) -> list["SnapshotNode"]:
+        return [SnapshotNode(self.snapshot, j) for j in self.snapshot.children(self.index)]
+
+    @property
+    def children_by_name(self) -> dict[str, "SnapshotNode"]:
+        return {self.snapshot.name(j): SnapshotNode(self.snapshot, j) for j in self.snapshot.children(self.index)}
+
+    def calculate_hash(self) -> str:
+        return self.content_hash
+
+    def serialize(self) -> bytes:
+        snapshot = self.snapshot
+
+        parts = []
+        for j in snapshot.children(self.index):
+            parts.append(f'{BLOB_TYPE if snapshot.is_blob(j) else TREE_TYPE} '.encode('ascii'))
+            parts.append(snapshot.names[snapshot.offsets[j]:snapshot.offsets[j + 1]])
+            parts.append(b'\0')
+            parts.append(snapshot.digests[j * DIGEST_SIZE:(j + 1) * DIGEST_SIZE])
+
+        return b''.join(parts)
+
+    def find(self, path : str) -> "SnapshotNode | None":
+        '''
+            looks the path up name by name, only the names compared on the way are decoded
+        '''
+        rel_path = os.path.relpath(path, self.path)
+        if rel_path == os.curdir:
+            return self
+        if rel_path.startswith(os.pardir):
+            return None
+
+        i = self.index
+        for name in rel_path.split(os.sep):
+            i = self.snapshot.child(i, name)
+            if i is None:
+                return None
+
+        return SnapshotNode(self.snapshot, i)
+
+    def invalidate(self) -> None:
+        raise TypeError('snapshot trees are read-only, see Snapshot.to_tree')
+
+    def mark_dirty(self, path : str) -> str:
+        raise TypeError('snapshot trees are read-only, see Snapshot.to_tree')
@@ -0,0 +1,80 @@
+'''
+    opt-in instrumentation of the diff engines and the file tree
+
+    nothing is recorded unless a collection is active, instrumented code checks
+    stats.active once per call and never inside its inner loops
+
+        with stats.collect() as s:
+            Myers(s1, s2, verbose=False)
+        print(s)
+
+    counters
+        myers.calls / myers.d / myers.snakes / myers.snake_chars / myers.degraded
+        lcs.calls / lcs.rows / lcs.cells
+        cleanup.merge_passes / cleanup.semantic_passes
+        filetree.stat / filetree.index_hits / filetree.hashed / filetree.bytes_read
+    maxima
+        myers.longest_snake / lcs.depth
+
+    only work done in this process is recorded, not the one of worker processes
+'''
+
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from tabulate import tabulate
+
+# collection currently recording, None when instrumentation is off
+active = None
+
+
+class Stats:
+    '''
+        named counters and maxima of one collection
+    '''
+    def __init__(self, callback : Callable[[str, int], None] | None = None) -> None:
+        '''
+            @param: callback - called with (name, value) for every recorded event
+        '''
+        self.counters = {}
+        self.maxima = {}
+        self.callback = callback
+
+    def add(self, name : str, value : int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+        if self.callback is not None:
+            self.callback(name, value)
+
+    def peak(self, name : str, value : int) -> None:
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+        if self.callback is not None:
+            self.callback(name, value)
+
+    def __getitem__(self, name : str) -> int:
+        if name in self.maxima:
+            return self.maxima[name]
+        return self.counters.get(name, 0)
+
+    def __repr__(self) -> str:
+        return tabulate(sorted({**self.counters, **self.maxima}.items()))
+
+
+@contextmanager
+def collect(callback : Callable[[str, int], None] | None = None) -> Iterator[Stats]:
+    '''
+        records the events of the enclosed block, collections can be nested,
+        the inner one records on its own
+
+        @param: callback - called with (name, value) for every recorded event
+
+        @yields: Stats of the block
+    '''
+    global active
+
+    previous = active
+    active = Stats(callback)
+    try:
+        yield active
+    finally:
+        active = previous
@@ -0,0 +1,291 @@
+'''
+    streaming line diff for files larger than memory
+
+    both files are memory-mapped and split into lines lazily, lines are compared as bytes
+    and never decoded, only a window of lines of each file is held at a time
+        - common lines at the front of the windows are passed through
+        - otherwise the windows are anchored on lines unique to both (patience diff),
+          the regions between anchors are diffed recursively the same way
+        - a region without anchors is reported as deleted and inserted
+
+    changes larger than the window are still reported correctly but may align less well
+
+    the line edits are turned into unified diff hunks as they are produced, the lines of
+    a hunk larger than MAX_HUNK_LINES are spilled to a temporary file until it is complete
+'''
+
+import mmap
+import os
+import tempfile
+from collections import deque
+from typing import Iterator
+
+from constants import EQUAL_OP, DELETION_OP, INSERTION_OP
+from utils import unique_anchors
+
+# lines of each file held in memory at a time
+WINDOW = 1 << 14
+# lines of context around the changes of a hunk
+CONTEXT = 3
+# lines of an open hunk held in memory, the rest is spilled to a temporary file
+MAX_HUNK_LINES = 1 << 14
+# bytes of a spilled hunk read back at once
+SPILL_READ = 1 << 20
+
+NO_NEWLINE = b'\\ No newline at end of file\n'
+
+
+def map_file(path : str) -> mmap.mmap | bytes:
+    '''
+        @returns: read-only memory map of the file, b'' for an empty file
+    '''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_lines(data : mmap.mmap | bytes) -> Iterator[bytes]:
+    '''
+        @yields: lines of the mapped file including their '\\n'
+    '''
+    pos, n = 0, len(data)
+
+    while pos < n:
+        end = data.find(b'\n', pos)
+        end = n if end == -1 else end + 1
+        yield data[pos:end]
+        pos = end
+
+
+def diff_region(a : list[bytes], b : list[bytes]) -> Iterator[tuple[str, bytes]]:
+    '''
+        patience diff of two lists of lines, ranges are processed through an explicit stack
+
+        @yields: (op, line)
+    '''
+    # stack of ranges (x0, x1, y0, y1), a range with x1 == -1 marks the matched anchor a[x0]
+    stack = [(0, len(a), 0, len(b))]
+
+    while stack:
+        x0, x1, y0, y1 = stack.pop()
+
+        if x1 == -1:
+            yield EQUAL_OP, a[x0]
+            continue
+
+        while x0 < x1 and y0 < y1 and a[x0] == b[y0]:
+            yield EQUAL_OP, a[x0]
+            x0, y0 = x0 + 1, y0 + 1
+
+        suffix = 0
+        while x1 - suffix > x0 and y1 - suffix > y0 and a[x1 - suffix - 1] == b[y1 - suffix - 1]:
+            suffix += 1
+
+        for k in range(1, suffix + 1):
+            stack.append((x1 - k, -1, y1 - k, -1))
+        x1, y1 = x1 - suffix, y1 - suffix
+
+        anchors = unique_anchors(a[x0:x1], b[y0:y1]) if x0 < x1 and y0 < y1 else []
+
+        if not anchors:
+            for x in range(x0, x1):
+                yield DELETION_OP, a[x]
+            for y in range(y0, y1):
+                yield INSERTION_OP, b[y]
+            continue
+
+        # ranges between the anchors, pushed in reverse so they come out in order
+        end_x, end_y = x1, y1
+        for i, j in reversed(anchors):
+            stack.append((x0 + i + 1, end_x, y0 + j + 1, end_y))
+            stack.append((x0 + i, -1, y0 + j, -1))
+            end_x, end_y = x0 + i, y0 + j
+        stack.append((x0, end_x, y0, end_y))
+
+
+def diff_lines(old : Iterator[bytes], new : Iterator[bytes], window : int = WINDOW) -> Iterator[tuple[str, bytes]]:
+    '''
+        windowed patience diff of two streams of lines
+
+        everything up to the last anchor of the windows is diffed and dropped, the
+        windows are then refilled, if the full windows have no anchor at all the
+        first half of both is reported as replaced
+
+        @yields: (op, line)
+    '''
+    a, b = deque(), deque()
+
+    while True:
+        while len(a) < window and (line := next(old, None)) is not None:
+            a.append(line)
+        while len(b) < window and (line := next(new, None)) is not None:
+            b.append(line)
+
+        if not a and not b:
+            return
+
+        # one of the files is exhausted
+        if not a or not b:
+            while a:
+                yield DELETION_OP, a.popleft()
+            while b:
+                yield INSERTION_OP, b.popleft()
+            continue
+
+        while a and b and a[0] == b[0]:
+            yield EQUAL_OP, a.popleft()
+            b.popleft()
+
+        if not a or not b:
+            continue
+
+        # the tails may be at the end of the files, they are diffed as a whole
+        at_end = len(a) < window and len(b) < window
+        la, lb = list(a), list(b)
+
+        if at_end:
+            yield from diff_region(la, lb)
+            a.clear()
+            b.clear()
+            continue
+
+        anchors = unique_anchors(la, lb)
+
+        if anchors:
+            i, j = anchors[-1]
+            yield from diff_region(la[:i + 1], lb[:j + 1])
+        else:
+            i, j = len(la) // 2 - 1, len(lb) // 2 - 1
+            for k in range(i + 1):
+                yield DELETION_OP, la[k]
+            for k in range(j + 1):
+                yield INSERTION_OP, lb[k]
+
+        for _ in range(i + 1):
+            a.popleft()
+        for _ in range(j + 1):
+            b.popleft()
+
+
+def hunk_lines(op : str, line : bytes) -> list[bytes]:
+    prefix = b' ' if op == EQUAL_OP else op.encode('ascii')
+    if line.endswith(b'\n'):
+        return [prefix + line]
+    return [prefix + line + b'\n', NO_NEWLINE]
+
+
+def unified_hunks(ops : Iterator[tuple[str, bytes]], context : int = CONTEXT,
+                  max_lines : int = MAX_HUNK_LINES) -> Iterator[bytes]:
+    '''
+        groups line edits into unified diff hunks
+        at most 2 * context + 1 equal lines are buffered besides the open hunk, and at most
+        max_lines lines of the open hunk, the other ones are spilled to a temporary file
+
+        @yields: pieces of the diff, each hunk starts a piece with its '@@' header
+                 followed by the prefixed lines, a large hunk spans several pieces
+    '''
+    old_no, new_no = 0, 0
+
+    # equal lines before the next hunk and equal lines after the last change of the open hunk
+    before = deque(maxlen=context)
+    after = []
+
+    hunk = None
+
+    def close() -> Iterator[bytes]:
+        for line in after[:context]:
+            hunk['lines'].extend(hunk_lines(EQUAL_OP, line))
+            hunk['old'] += 1
+            hunk['new'] += 1
+
+        old_start = hunk['old_start'] + 1 if hunk['old'] else hunk['old_start']
+        new_start = hunk['new_start'] + 1 if hunk['new'] else hunk['new_start']
+        header = f'@@ -{old_start},{hunk["old"]} +{new_start},{hunk["new"]} @@\n'.encode('ascii')
+
+        spill = hunk['spill']
+        if spill is None:
+            yield header + b''.join(hunk['lines'])
+            return
+
+        yield header
+        with spill:
+            spill.seek(0)
+            while data := spill.read(SPILL_READ):
+                yield data
+        yield b''.join(hunk['lines'])
+
+    for op, line in ops:
+        if op == EQUAL_OP:
+            old_no, new_no = old_no + 1, new_no + 1
+
+            if hunk is None:
+                before.append(line)
+                continue
+
+            after.append(line)
+            if len(after) > 2 * context:
+                yield from close()
+                before.extend(after[context:])
+                after, hunk = [], None
+            continue
+
+        if hunk is None:
+            hunk = {
+                'old_start': old_no - len(before), 'new_start': new_no - len(before),
+                'old': len(before), 'new': len(before),
+                'lines': [l for line in before for l in hunk_lines(EQUAL_OP, line)],
+                'spill': None,
+            }
+            before.clear()
+        else:
+            for line_after in after:
+                hunk['lines'].extend(hunk_lines(EQUAL_OP, line_after))
+            hunk['old'] += len(after)
+            hunk['new'] += len(after)
+            after = []
+
+        hunk['lines'].extend(hunk_lines(op, line))
+        if op == DELETION_OP:
+            hunk['old'] += 1
+            old_no += 1
+        else:
+            hunk['new'] += 1
+            new_no += 1
+
+        if len(hunk['lines']) >= max_lines:
+            if hunk['spill'] is None:
+                hunk['spill'] = tempfile.TemporaryFile()
+            hunk['spill'].writelines(hunk['lines'])
+            hunk['lines'] = []
+
+    if hunk is not None:
+        yield from close()
+
+
+def stream_diff(old_path : str, new_path : str, context : int = CONTEXT, window : int = WINDOW,
+                max_lines : int = MAX_HUNK_LINES) -> Iterator[bytes]:
+    '''
+        unified diff of two files of any size
+
+        @param: context - lines of context around the changes
+        @param: window - lines of each file held in memory
+        @param: max_lines - lines of a hunk held in memory
+
+        @yields: the unified diff hunks as pieces of bytes, see unified_hunks
+    '''
+    old, new = map_file(old_path), map_file(new_path)
+
+    try:
+        yield from unified_hunks(diff_lines(iter_lines(old), iter_lines(new), window), context, max_lines)
+    finally:
+        for data in (old, new):
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    for hunk in stream_diff(sys.argv[1], sys.argv[2]):
+        sys.stdout.buffer.write(hunk)
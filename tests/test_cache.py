@@ -0,0 +1,33 @@
+from chunk import CHUNK_THRESHOLD
+from cache import DiffCache, text_sha
+from constants import BLOB_TYPE
+from myers import Myers
+from objects import ObjectStore
+
+
+def test_text_sha_is_blob_id(tmp_path):
+    store = ObjectStore(str(tmp_path / 'objects'))
+
+    for text in ('', 'hello\n', 'café\n' * 1000):
+        assert text_sha(text) == store.write(BLOB_TYPE, text.encode('utf-8'))
+
+
+def test_text_sha_of_large_text_is_chunk_list_id(tmp_path):
+    store = ObjectStore(str(tmp_path / 'objects'))
+
+    text = ''.join(f'{i:08d}\n' for i in range(CHUNK_THRESHOLD // 9 + 1))
+    path = tmp_path / 'large.txt'
+    path.write_text(text, encoding='utf-8')
+
+    assert text_sha(text) == store.write_file(str(path))
+
+
+def test_key_from_blob_ids_hits(tmp_path):
+    cache = DiffCache()
+    Myers('abc', 'abd', verbose=False, cache=cache)
+
+    store = ObjectStore(str(tmp_path / 'objects'))
+    old, new = store.write(BLOB_TYPE, b'abc'), store.write(BLOB_TYPE, b'abd')
+    key = cache.key(old, new, 'myers', 'c', {'linear': False, 'cleanup': 'semantic'})
+
+    assert cache.get(key) is not None
@@ -0,0 +1,33 @@
+import random
+
+from delta import apply_delta, create_delta
+
+
+def edited(base : bytes, rng : random.Random) -> bytes:
+    target = bytearray(base)
+    for _ in range(rng.randint(0, 10)):
+        i = rng.randint(0, len(target))
+        target[i:i + rng.randint(0, 30)] = rng.randbytes(rng.randint(0, 30))
+    return bytes(target)
+
+
+def test_round_trip_and_budget():
+    rng = random.Random(2)
+
+    for _ in range(500):
+        base = bytes(rng.choice(b'abcd') for _ in range(rng.randint(0, 400)))
+        target = edited(base, rng)
+
+        delta = create_delta(base, target)
+        assert apply_delta(base, delta) == target
+
+        # a budget only decides whether the same delta is returned
+        for max_size in (len(delta) - 1, len(delta), len(target) // 2):
+            assert create_delta(base, target, max_size=max_size) == (delta if len(delta) <= max_size else None)
+
+
+def test_dissimilar_target_stops_early():
+    rng = random.Random(3)
+    base, target = rng.randbytes(1 << 16), rng.randbytes(1 << 16)
+
+    assert create_delta(base, target, max_size=len(target) // 2) is None
@@ -0,0 +1,59 @@
+import time
+
+from constants import EQUAL_OP, DELETION_OP, INSERTION_OP
+from diff import Diff, Diffs
+
+
+def texts(diffs : list[Diff]) -> tuple[str, str]:
+    return ''.join(d.old_str for d in diffs if d.op != INSERTION_OP), \
+           ''.join(d.new_str for d in diffs if d.op != DELETION_OP)
+
+
+def chaff(fragments : int) -> list[Diff]:
+    '''
+        short edits alternating with short equalities, like Myers output on dissimilar texts
+    '''
+    diffs = []
+    for i in range(fragments):
+        if i % 3 == 0:
+            diffs.append(Diff(EQUAL_OP, 'a', 'a'))
+        elif i % 3 == 1:
+            diffs.append(Diff(DELETION_OP, 'xy', None))
+        else:
+            diffs.append(Diff(INSERTION_OP, None, 'zw'))
+    return diffs
+
+
+def timed_cleanup(fragments : int) -> float:
+    diffs = chaff(fragments)
+    expected = texts(diffs)
+
+    start = time.perf_counter()
+    result = Diffs(diffs)
+    result.cleanup()
+    elapsed = time.perf_counter() - start
+
+    assert texts(result.diffs) == expected
+    return elapsed
+
+
+def test_trailing_edit_is_shifted():
+    diffs = Diffs([Diff(EQUAL_OP, 'a', 'a'), Diff(INSERTION_OP, None, 'aa')])
+    diffs.cleanup()
+
+    assert [(d.op, d.diff_str) for d in diffs.diffs] == [(INSERTION_OP, 'aa'), (EQUAL_OP, 'a')]
+
+
+def test_semantic_cleanup_folds_chaff():
+    diffs = Diffs(chaff(3000))
+    diffs.cleanup()
+
+    assert [d.op for d in diffs.diffs] == [EQUAL_OP, DELETION_OP, INSERTION_OP]
+
+
+def test_semantic_cleanup_scales_linearly():
+    small = timed_cleanup(3000)
+    large = timed_cleanup(24000)
+
+    # 8 times the fragments, quadratic time would be about 64 times slower
+    assert large < 20 * max(small, 0.005)
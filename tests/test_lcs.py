@@ -0,0 +1,26 @@
+import random
+import time
+
+import pytest
+
+from constants import DELETION_OP, INSERTION_OP
+from lcs import LCS
+from patience import Patience
+
+
+def random_lines(count : int, rng : random.Random) -> str:
+    return '\n'.join(str(rng.randint(0, 3000)) for _ in range(count))
+
+
+@pytest.mark.parametrize('engine, options', [(LCS, {}), (LCS, {'bit_parallel': True}), (Patience, {})])
+def test_timeout_caps_wall_time(engine, options):
+    rng = random.Random(1)
+    s1, s2 = random_lines(20000, rng), random_lines(20000, rng)
+
+    start = time.perf_counter()
+    diffs = engine(s1, s2, timeout=0.5, **options).to_diff()
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 5
+    assert '\n'.join(d.old_str for d in diffs.diffs if d.op != INSERTION_OP) == s1
+    assert '\n'.join(d.new_str for d in diffs.diffs if d.op != DELETION_OP) == s2
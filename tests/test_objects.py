@@ -0,0 +1,31 @@
+import random
+
+from constants import BLOB_TYPE, TREE_TYPE
+from objects import ObjectStore
+
+
+def test_repack_round_trip(tmp_path):
+    rng = random.Random(1)
+    store = ObjectStore(str(tmp_path / 'objects'))
+
+    base = rng.randbytes(20000)
+    objects = {}
+    for i in range(30):
+        data = bytearray(base)
+        data[i * 100:i * 100 + 50] = rng.randbytes(50)
+        objects[store.write(BLOB_TYPE, bytes(data))] = (BLOB_TYPE, bytes(data))
+
+    tree = b''.join(f'{BLOB_TYPE} f{i}\0'.encode('ascii') + bytes.fromhex(sha) for i, sha in enumerate(sorted(objects)))
+    objects[store.write(TREE_TYPE, tree)] = (TREE_TYPE, tree)
+
+    pack_path = store.repack()
+
+    assert store.loose_objects() == []
+    assert store.repack() is None
+
+    reopened = ObjectStore(str(tmp_path / 'objects'))
+    for sha, obj in objects.items():
+        assert reopened.read(sha) == obj
+
+    # similar blobs are stored as deltas
+    assert sum(len(data) for _, data in objects.values()) > 4 * len(open(pack_path, 'rb').read())
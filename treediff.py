@@ -0,0 +1,146 @@
+'''
+    diff between two file trees
+
+    subtrees with equal hashes are skipped entirely, so the cost is proportional
+    to the number of changed paths instead of the size of the trees
+'''
+
+import os
+from typing import Iterator, NamedTuple
+
+from constants import BLOB_TYPE, TREE_TYPE, ADDED, REMOVED, MODIFIED, RENAMED
+from filetree import FileTreeNode
+from objects import ObjectStore
+
+
+class TreeChange(NamedTuple):
+    '''
+        a changed blob path between two trees
+    '''
+    status : str
+    old_path : str | None
+    new_path : str | None
+    old_hash : str | None
+    new_hash : str | None
+
+
+def tree_entries(tree : FileTreeNode | str, store : ObjectStore | None) -> dict:
+    '''
+        @param: tree - directory node or hex digest of a stored tree
+
+        @returns: name -> (object type, hex digest, subtree) in tree order
+    '''
+    if isinstance(tree, FileTreeNode):
+        return {
+            os.path.basename(child.path): (BLOB_TYPE if child.is_blob else TREE_TYPE, child.content_hash, child)
+            for child in tree.children
+        }
+
+    if store is None:
+        raise ValueError('an object store is needed to diff stored trees')
+
+    return {name: (obj_type, sha, sha) for obj_type, name, sha in store.read_tree(tree)}
+
+
+def tree_hash(tree : FileTreeNode | str) -> str:
+    return tree.content_hash if isinstance(tree, FileTreeNode) else tree    # type: ignore
+
+
+def iter_blobs(tree : FileTreeNode | str, prefix : str, store : ObjectStore | None) -> Iterator[tuple[str, str]]:
+    '''
+        @returns: generator of (path, blob hash) of every blob below the tree
+    '''
+    stack = [(tree, prefix)]
+
+    while stack:
+        node, node_prefix = stack.pop()
+        for name, (obj_type, sha, child) in tree_entries(node, store).items():
+            if obj_type == BLOB_TYPE:
+                yield node_prefix + name, sha
+            else:
+                stack.append((child, node_prefix + name + '/'))
+
+
+def diff_trees(old : FileTreeNode | str, new : FileTreeNode | str, store : ObjectStore | None = None,
+               detect_renames : bool = False) -> Iterator[TreeChange]:
+    '''
+        compare two trees and stream the changed blob paths
+
+        @param: old - root node or hex digest of a stored tree (needs store)
+        @param: new - root node or hex digest of a stored tree (needs store)
+        @param: store - object store holding the stored trees
+        @param: detect_renames - pair removed and added blobs with the same hash as renames,
+                                 additions and removals are then reported at the end
+
+        @returns: generator of TreeChange with paths relative to the roots
+    '''
+    added, removed = [], []
+
+    def report(change : TreeChange) -> Iterator[TreeChange]:
+        if detect_renames and change.status == ADDED:
+            added.append(change)
+        elif detect_renames and change.status == REMOVED:
+            removed.append(change)
+        else:
+            yield change
+
+    stack = [(old, new, '')]
+
+    while stack:
+        old_tree, new_tree, prefix = stack.pop()
+
+        if tree_hash(old_tree) == tree_hash(new_tree):
+            continue
+
+        old_entries = tree_entries(old_tree, store)
+        new_entries = tree_entries(new_tree, store)
+
+        for name, (old_type, old_sha, old_child) in old_entries.items():
+            path = prefix + name
+            new_entry = new_entries.get(name)
+
+            if new_entry is not None and new_entry[1] == old_sha:
+                continue
+
+            if new_entry is not None and new_entry[0] == old_type:
+                if old_type == BLOB_TYPE:
+                    yield from report(TreeChange(MODIFIED, path, path, old_sha, new_entry[1]))
+                else:
+                    stack.append((old_child, new_entry[2], path + '/'))
+                continue
+
+            if old_type == BLOB_TYPE:
+                yield from report(TreeChange(REMOVED, path, None, old_sha, None))
+            else:
+                for blob_path, sha in iter_blobs(old_child, path + '/', store):
+                    yield from report(TreeChange(REMOVED, blob_path, None, sha, None))
+
+        for name, (new_type, new_sha, new_child) in new_entries.items():
+            path = prefix + name
+            old_entry = old_entries.get(name)
+
+            if old_entry is not None and (old_entry[1] == new_sha or old_entry[0] == new_type):
+                continue
+
+            if new_type == BLOB_TYPE:
+                yield from report(TreeChange(ADDED, None, path, None, new_sha))
+            else:
+                for blob_path, sha in iter_blobs(new_child, path + '/', store):
+                    yield from report(TreeChange(ADDED, None, blob_path, None, sha))
+
+    if detect_renames:
+        # removed blobs by hash, matched in order of appearance
+        removed_by_hash = {}
+        for change in removed:
+            removed_by_hash.setdefault(change.old_hash, []).append(change)
+
+        for change in added:
+            candidates = removed_by_hash.get(change.new_hash)
+            if candidates:
+                source = candidates.pop(0)
+                yield TreeChange(RENAMED, source.old_path, change.new_path, source.old_hash, change.new_hash)
+            else:
+                yield change
+
+        for candidates in removed_by_hash.values():
+            yield from candidates
@@ -2,6 +2,11 @@
     module for imeplementing utility functions for string processing
 '''
 
+from bisect import bisect_left
+
+# occurrences of the seed tried by half_match_at
+HALF_MATCH_SEEDS = 4
+
 
 def common_prefix(s1, s2):
     l = 0
@@ -16,11 +21,103 @@ def common_prefix(s1, s2):
 
 def common_suffix(s1, s2):
     l = 1
-    while l < len(s1) and l < len(s2):
+    while l <= len(s1) and l <= len(s2):
         if s1[-l] == s2[-l]:
             l += 1
         else:
             break
 
     return l - 1
-    
\ No newline at end of file
+    
+
+
+def half_match_at(long, short, i):
+    '''
+        looks for a substring of short matching the quarter of long starting at i,
+        grown into the longest common substring around it
+        at most HALF_MATCH_SEEDS occurrences of the quarter are tried, so the cost is linear
+
+        @returns: (start in long, start in short, length) or None
+    '''
+    seed = long[i:i + len(long) // 4]
+    best = None
+
+    # repetitive texts have a seed occurrence every few characters, only the first ones are tried
+    j = short.find(seed)
+    for _ in range(HALF_MATCH_SEEDS):
+        if j == -1:
+            break
+        prefix = common_prefix(long[i:], short[j:])
+        suffix = common_suffix(long[:i], short[:j])
+        if best is None or prefix + suffix > best[2]:
+            best = (i - suffix, j - suffix, prefix + suffix)
+        j = short.find(seed, j + 1)
+
+    if best is None or best[2] * 2 < len(long):
+        return None
+
+    return best
+
+def half_match(s1, s2):
+    '''
+        finds a common substring at least half as long as the longer text
+        it splits the texts into two smaller problems without searching the edit graph
+
+        @returns: (start in s1, start in s2, length) or None
+    '''
+    swapped = len(s1) < len(s2)
+    long, short = (s2, s1) if swapped else (s1, s2)
+
+    if len(long) < 4 or len(short) * 2 < len(long):
+        return None
+
+    # seed on the second and the third quarter of the longer text
+    candidates = [half_match_at(long, short, (len(long) + 3) // 4), half_match_at(long, short, (len(long) + 1) // 2)]
+    candidates = [c for c in candidates if c is not None]
+    if not candidates:
+        return None
+
+    i, j, length = max(candidates, key=lambda c: c[2])
+
+    return (j, i, length) if swapped else (i, j, length)
+
+def unique_anchors(a, b):
+    '''
+        patience anchors of two sequences: items occurring exactly once in both,
+        reduced to the longest run of pairs increasing in both sequences
+
+        @returns: list of (index in a, index in b) in increasing order
+    '''
+    # item -> index of its single occurrence, -1 if it occurs more than once
+    once_a = {}
+    for i, x in enumerate(a):
+        once_a[x] = -1 if x in once_a else i
+
+    once_b = {}
+    for j, x in enumerate(b):
+        once_b[x] = -1 if x in once_b else j
+
+    pairs = sorted((i, once_b[x]) for x, i in once_a.items() if i != -1 and once_b.get(x, -1) != -1)
+
+    # longest increasing subsequence of the b indices by patience sorting
+    tails, tail_pairs = [], []
+    prev = [-1] * len(pairs)
+
+    for p, (_, j) in enumerate(pairs):
+        k = bisect_left(tails, j)
+        prev[p] = tail_pairs[k - 1] if k else -1
+        if k == len(tails):
+            tails.append(j)
+            tail_pairs.append(p)
+        else:
+            tails[k] = j
+            tail_pairs[k] = p
+
+    anchors = []
+    p = tail_pairs[-1] if tail_pairs else -1
+    while p != -1:
+        anchors.append(pairs[p])
+        p = prev[p]
+    anchors.reverse()
+
+    return anchors
@@ -0,0 +1,423 @@
+'''
+    inotify backed change tracking of the working directory (linux only)
+
+    a long lived watcher records the paths of changed entries into .minigit/journal
+    and the next tree build re-stats and re-hashes only those paths, the rest of the
+    tree is taken from the index and from the directory list of the previous build
+
+    the journal is a sequence of NUL terminated paths relative to the root,
+    FULL_SCAN forces the next build to walk the whole tree, it is written when
+        - the watcher starts, changes made while no watcher ran are unknown
+        - the kernel event queue overflowed
+        - .minigitignore changed, the watcher reloads the rules and watches the
+          directories they no longer ignore
+        - a new directory could not be watched, the watcher exits after writing it
+    without a running watcher every build is a full scan
+
+    run as: python watch.py
+'''
+
+import ctypes
+import ctypes.util
+import fcntl
+import os
+import signal
+import struct
+import sys
+
+from constants import ALWAYS_IGNORED, IGNORE_FILE, MINIGIT_DIR
+from filetree import FileTreeNode, assemble_paths, blob_hash, create_file_tree_recursive, walk_tree
+from ignore import IgnoreRules
+from index import Index
+from objects import ObjectStore
+
+JOURNAL_FILE = 'journal'
+WATCHER_FILE = 'watcher'
+DIRS_FILE = 'dirs'
+
+# journal record forcing a full scan
+FULL_SCAN = '/'
+
+# inotify(7)
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0x80000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+# watch descriptor, mask, cookie, length of the name
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# bytes of events read at once
+EVENT_BUFFER = 1 << 16
+
+
+class ChangeJournal:
+    '''
+        dirty paths recorded by the watcher, shared through files under .minigit
+
+        appends and takes are serialized with an exclusive lock on the journal file
+    '''
+    def __init__(self, local_dir : str) -> None:
+        '''
+            @param: local_dir - the .minigit directory
+        '''
+        self.journal_path = os.path.join(local_dir, JOURNAL_FILE)
+        # paths taken by a build that has not completed yet
+        self.taken_path = self.journal_path + '.taken'
+        self.watcher_path = os.path.join(local_dir, WATCHER_FILE)
+        self.dirs_path = os.path.join(local_dir, DIRS_FILE)
+
+        # directories of the build in progress, saved by done
+        self.dirs = None
+
+    def append(self, paths : list[str]) -> None:
+        '''
+            record paths relative to the root, called by the watcher
+        '''
+        data = b''.join(path.encode('utf-8', 'surrogateescape') + b'\0' for path in paths)
+
+        while True:
+            with open(self.journal_path, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # the journal may have been taken while waiting for the lock
+                try:
+                    if os.stat(self.journal_path).st_ino != os.fstat(f.fileno()).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue
+                f.write(data)
+                return
+
+    def take(self) -> set[str] | None:
+        '''
+            collect the recorded paths, called by a build
+            the paths are kept until done is called, a failed build takes them again
+
+            @returns: dirty paths relative to the root, None if a full scan is needed
+        '''
+        if not self.watcher_alive():
+            return None
+
+        try:
+            with open(self.journal_path, 'rb') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                data = f.read()
+                with open(self.taken_path, 'ab') as taken:
+                    taken.write(data)
+                os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(self.taken_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return set()
+
+        paths = set(data.decode('utf-8', 'surrogateescape').split('\0'))
+        paths.discard('')
+
+        return None if FULL_SCAN in paths else paths
+
+    def done(self) -> None:
+        '''
+            save the directories of the build and drop the taken paths,
+            called once the build and its index are saved
+        '''
+        if self.dirs is not None:
+            self.save_dirs(self.dirs)
+            self.dirs = None
+
+        try:
+            os.remove(self.taken_path)
+        except FileNotFoundError:
+            pass
+
+    def watcher_alive(self) -> bool:
+        try:
+            with open(self.watcher_path) as f:
+                pid = int(f.read())
+            os.kill(pid, 0)
+        except (FileNotFoundError, ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            pass
+
+        return True
+
+    def load_dirs(self) -> set[str] | None:
+        '''
+            @returns: directories of the previous build, None if unknown
+        '''
+        try:
+            with open(self.dirs_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        dirs = set(data.decode('utf-8', 'surrogateescape').split('\0'))
+        dirs.discard('')
+
+        return dirs
+
+    def save_dirs(self, dirs : set[str]) -> None:
+        tmp_path = self.dirs_path + '.lock'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(path.encode('utf-8', 'surrogateescape') + b'\0' for path in dirs))
+        os.replace(tmp_path, self.dirs_path)
+
+
+class Watcher:
+    '''
+        inotify watches on every non ignored directory of the working directory
+    '''
+    def __init__(self, root : str, journal : ChangeJournal, ignore : IgnoreRules | None = None) -> None:
+        '''
+            @param: root - working directory
+            @param: journal - journal the changed paths are recorded into
+            @param: ignore - compiled ignore rules, ignored paths are neither watched nor recorded
+        '''
+        self.root = root
+        self.journal = journal
+        self.ignore = ignore
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        # watch descriptor -> directory path relative to the root, '' for the root
+        self.watches = {}
+
+    def add_watches(self, rel_path : str) -> None:
+        '''
+            watch a directory and every non ignored directory below it
+        '''
+        path = os.path.join(self.root, rel_path) if rel_path else self.root
+        prefix = rel_path + '/' if rel_path else ''
+
+        for dir_path, _ in walk_tree(path, self.ignore, prefix):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'can not watch {dir_path}')
+
+            rel = os.path.relpath(dir_path, self.root)
+            self.watches[wd] = '' if rel == os.curdir else rel.replace(os.sep, '/')
+
+    def reload_ignore(self) -> None:
+        '''
+            recompile the ignore rules and watch the directories they no longer ignore
+            directories that became ignored stay watched, their events are filtered out
+        '''
+        self.ignore = IgnoreRules.from_file(os.path.join(self.root, IGNORE_FILE))
+        self.add_watches('')
+
+    def events(self, data : bytes):
+        '''
+            @yields: (mask, directory path relative to the root, name) of the events in a read
+        '''
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+
+            yield mask, self.watches.get(wd), name
+
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+
+    def run(self) -> None:
+        '''
+            watch until interrupted, the watcher file is removed on exit
+        '''
+        self.add_watches('')
+
+        # changes made before the watches were set up are unknown
+        self.journal.append([FULL_SCAN])
+
+        with open(self.journal.watcher_path, 'w') as f:
+            f.write(str(os.getpid()))
+
+        try:
+            while True:
+                dirty = []
+                stop = False
+
+                for mask, dir_path, name in self.events(os.read(self.fd, EVENT_BUFFER)):
+                    if mask & IN_Q_OVERFLOW:
+                        dirty.append(FULL_SCAN)
+                        continue
+
+                    if dir_path is None:
+                        continue
+
+                    if not name:
+                        # the root itself went away
+                        if dir_path == '' and mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                            dirty.append(FULL_SCAN)
+                            stop = True
+                        continue
+
+                    rel_path = dir_path + '/' + name if dir_path else name
+                    is_dir = bool(mask & IN_ISDIR)
+
+                    if rel_path == IGNORE_FILE:
+                        # paths may have been ignored or un-ignored anywhere
+                        dirty.append(FULL_SCAN)
+                        try:
+                            self.reload_ignore()
+                        except OSError:
+                            stop = True
+                        continue
+
+                    if is_dir and name in ALWAYS_IGNORED:
+                        continue
+                    if self.ignore is not None and self.ignore.is_ignored(rel_path, is_dir):
+                        continue
+
+                    dirty.append(rel_path)
+
+                    if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self.add_watches(rel_path)
+                        except FileNotFoundError:
+                            pass
+                        except OSError:
+                            # changes below the directory would go unnoticed
+                            dirty.append(FULL_SCAN)
+                            stop = True
+
+                if dirty:
+                    self.journal.append(list(dict.fromkeys(dirty)))
+                if stop:
+                    return
+        finally:
+            try:
+                os.remove(self.journal.watcher_path)
+            except FileNotFoundError:
+                pass
+            os.close(self.fd)
+
+
+def create_file_tree_tracked(cwd : str, journal : ChangeJournal, index : Index,
+                             ignore : IgnoreRules | None = None, store : ObjectStore | None = None) -> FileTreeNode:
+    '''
+        form the file tree from the previous build and the journal of a running watcher
+        only recorded paths are stat'ed and hashed, falls back to a full scan when the
+        journal can not be trusted
+
+        call journal.done once the index is saved, it saves the directory list for the next build
+
+        @param: index - loaded index of the previous build, it holds the hashes of the untouched blobs
+        @param: ignore - compiled ignore rules
+        @param: store - object store, new blobs are hashed and stored in the same read
+    '''
+    dirty = journal.take()
+    dirs = journal.load_dirs() if dirty is not None else None
+
+    # the index and the directory list have to describe the same build
+    if dirs is not None and (cwd not in dirs or any(os.path.dirname(path) not in dirs for path in index.entries)):
+        dirs = None
+
+    if dirty is None or dirs is None:
+        root = create_file_tree_recursive(cwd, index, ignore, store)
+
+        dirs = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if not node.is_blob:
+                dirs.add(node.path)
+                stack.extend(node.children)
+
+        journal.dirs = dirs
+        return root
+
+    hashes = {path: entry[3] for path, entry in index.entries.items()}
+    changed = set()
+
+    for rel_path in sorted(dirty):
+        path = os.path.join(cwd, *rel_path.split('/'))
+
+        # forget everything known at and below the path
+        hashes.pop(path, None)
+        changed.discard(path)
+        if path in dirs:
+            below = path + os.sep
+            dirs = {d for d in dirs if d != path and not d.startswith(below)}
+            for p in [p for p in hashes if p.startswith(below)]:
+                del hashes[p]
+            changed = {p for p in changed if not p.startswith(below)}
+
+        if os.path.dirname(path) not in dirs:
+            continue
+
+        try:
+            is_dir = os.path.isdir(path)
+            if not is_dir and not os.path.isfile(path):
+                continue
+        except OSError:
+            continue
+
+        if is_dir and os.path.basename(path) in ALWAYS_IGNORED:
+            continue
+        if ignore is not None and ignore.is_ignored(rel_path, is_dir):
+            continue
+
+        if not is_dir:
+            changed.add(path)
+            continue
+
+        for dir_path, entries in walk_tree(path, ignore, rel_path + '/'):
+            dirs.add(dir_path)
+            changed.update(entry.path for entry in entries if not entry.is_dir())
+
+    for path in changed:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            hashes.pop(path, None)
+            continue
+
+        hashes[path], _ = blob_hash(path, st, index, store)
+
+    for path, content_hash in hashes.items():
+        if path in changed:
+            continue
+        # blobs hashed by a build without a store are stored now
+        if store is not None and not store.contains(content_hash):
+            store.write_file(path)
+        index.keep(path)
+
+    journal.dirs = dirs
+
+    return assemble_paths(cwd, dirs, hashes)
+
+
+if __name__ == '__main__':
+    cwd = os.getcwd()
+    local_dir = os.path.join(cwd, MINIGIT_DIR)
+
+    # exit through the finally clause of run, so the watcher file is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        Watcher(cwd, ChangeJournal(local_dir), IgnoreRules.from_file(os.path.join(cwd, IGNORE_FILE))).run()
+    except KeyboardInterrupt:
+        pass